@@ -1,19 +1,220 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
 from langchain_core.prompts import ChatPromptTemplate
+import time
 from model.prompts import SCHEDULER_SYSTEM_PROMPT, PLANNER_SYSTEM_PROMPT 
 from model.output_classes import WeeklySummary, DailyPlan 
+from utils.cache import SQLiteCache, make_cache_key
+from utils.limiter import ConcurrencyLimiter
+from utils.cassette import Cassette
+from utils.metrics import metrics
 import dotenv
 import os 
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Records LLM call latency and prompt and completion tokens in the metrics registry."""
+    # Record in the caller's context so the counts reach the run's own registry too
+    run_inline = True
+
+    def __init__(self):
+        self._started = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._started.pop(run_id, None)
+        metrics.inc('llm_errors_total')
+
+    def on_llm_end(self, response: LLMResult, *, run_id=None, **kwargs) -> None:
+        llm_output = response.llm_output or {}
+        usage = llm_output.get('token_usage') or {}
+        prompt_tokens = usage.get('prompt_tokens')
+        completion_tokens = usage.get('completion_tokens')
+        if prompt_tokens is None:
+            # Providers without token_usage report it on the message instead
+            message = getattr(response.generations[0][0], 'message', None) if response.generations else None
+            usage = getattr(message, 'usage_metadata', None) or {}
+            prompt_tokens = usage.get('input_tokens', 0)
+            completion_tokens = usage.get('output_tokens', 0)
+        model = llm_output.get('model_name', 'unknown')
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            metrics.observe('llm_request_seconds', time.perf_counter() - started, model=model)
+        metrics.inc('llm_requests_total', model=model)
+        metrics.inc('llm_tokens_total', prompt_tokens, model=model, kind='prompt')
+        metrics.inc('llm_tokens_total', completion_tokens or 0, model=model, kind='completion')
+
+
+token_usage_callback = TokenUsageCallback()
+
+
+def cassette_key(prompt_value, schema) -> str:
+    """Cassette key of an LLM call: its rendered prompt and output schema."""
+    return make_cache_key(prompt_value.to_string(), schema.__name__)
+
+
+class CachedStructuredChain:
+    """
+    Prompt | structured-output LLM chain backed by a persistent response cache.
+
+    Responses are keyed by the rendered prompt, model name, temperature and output
+    schema, so replaying the same user description or daily agenda costs no tokens.
+    Only cache misses take a slot of the optional concurrency limiter.
+
+    A recording ``cassette`` sits below the cache: misses are recorded with the time
+    the LLM took, hits without a duration, so a warm cache never passes for a fast LLM.
+    """
+    def __init__(self, prompt: ChatPromptTemplate, llm, schema, cache: SQLiteCache,
+                 limiter: ConcurrencyLimiter = None, cassette: Cassette = None):
+        self.prompt = prompt
+        self.schema = schema
+        self.cache = cache
+        self.limiter = limiter
+        self.cassette = cassette
+        self.chain = llm.with_structured_output(schema).with_config(callbacks=[token_usage_callback])
+        self.model_name = getattr(llm, 'model_name', None) or getattr(llm, 'model', None)
+        self.temperature = getattr(llm, 'temperature', None)
+
+    def cache_key(self, prompt_value) -> str:
+        return make_cache_key(
+            prompt_value.to_string(),
+            self.model_name,
+            self.temperature,
+            self.schema.__name__,
+            self.schema.model_json_schema(),
+        )
+
+    def _cached(self, prompt_value, key):
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        result = self.schema.model_validate_json(cached)
+        if self.cassette is not None:
+            self.cassette.record('llm', cassette_key(prompt_value, self.schema), result.model_dump(mode='json'), None)
+        return result
+
+    def invoke(self, inputs, config=None):
+        prompt_value = self.prompt.invoke(inputs)
+        key = self.cache_key(prompt_value)
+        cached = self._cached(prompt_value, key)
+        if cached is not None:
+            return cached
+        if self.cassette is not None:
+            result = self.cassette.call_sync(
+                'llm', cassette_key(prompt_value, self.schema), lambda: self.chain.invoke(prompt_value, config),
+                encode=lambda result: result.model_dump(mode='json'),
+            )
+        else:
+            result = self.chain.invoke(prompt_value, config)
+        self.cache.set(key, result.model_dump_json())
+        return result
+
+    async def _call_llm(self, prompt_value, config):
+        if self.limiter is not None:
+            async with self.limiter.slot():
+                return await self.chain.ainvoke(prompt_value, config)
+        return await self.chain.ainvoke(prompt_value, config)
+
+    async def ainvoke(self, inputs, config=None):
+        prompt_value = await self.prompt.ainvoke(inputs)
+        key = self.cache_key(prompt_value)
+        cached = self._cached(prompt_value, key)
+        if cached is not None:
+            return cached
+        if self.cassette is not None:
+            result = await self.cassette.call(
+                'llm', cassette_key(prompt_value, self.schema), lambda: self._call_llm(prompt_value, config),
+                encode=lambda result: result.model_dump(mode='json'),
+            )
+        else:
+            result = await self._call_llm(prompt_value, config)
+        self.cache.set(key, result.model_dump_json())
+        return result
+
+
+class LimitedChain:
+    """Runs a chain's async calls under a shared concurrency limiter."""
+    def __init__(self, chain, limiter: ConcurrencyLimiter):
+        self.chain = chain
+        self.limiter = limiter
+
+    def invoke(self, inputs, config=None):
+        return self.chain.invoke(inputs, config)
+
+    async def ainvoke(self, inputs, config=None):
+        async with self.limiter.slot():
+            return await self.chain.ainvoke(inputs, config)
+
+
+class CassetteChain:
+    """
+    Records a structured-output chain's results to a cassette, or replays them without
+    calling the LLM. Keyed by the rendered prompt and schema; replays hold a slot of the
+    optional limiter, like live calls.
+    """
+    def __init__(self, prompt: ChatPromptTemplate, chain, schema, cassette: Cassette,
+                 limiter: ConcurrencyLimiter = None):
+        self.prompt = prompt
+        self.chain = chain
+        self.schema = schema
+        self.cassette = cassette
+        self.limiter = limiter
+
+    def cassette_key(self, inputs) -> str:
+        return cassette_key(self.prompt.invoke(inputs), self.schema)
+
+    def invoke(self, inputs, config=None):
+        return self.cassette.call_sync(
+            'llm', self.cassette_key(inputs), lambda: self.chain.invoke(inputs, config),
+            encode=lambda result: result.model_dump(mode='json'), decode=self.schema.model_validate,
+        )
+
+    async def ainvoke(self, inputs, config=None):
+        return await self.cassette.call(
+            'llm', self.cassette_key(inputs), lambda: self.chain.ainvoke(inputs, config),
+            encode=lambda result: result.model_dump(mode='json'), decode=self.schema.model_validate,
+            slot=self.limiter.slot if self.limiter is not None else None,
+        )
+
+
 class agent_creator:
-    def __init__(self,llm):
+    def __init__(self, llm, cache: SQLiteCache = None, limiter: ConcurrencyLimiter = None,
+                 cassette: Cassette = None):
         self.llm = llm    
+        self.cache = cache
+        self.limiter = limiter
+        self.cassette = cassette
+
+    def _create_chain(self, prompt, schema):
+        prompt = ChatPromptTemplate.from_messages([("system", prompt)])
+        if self.cassette is not None and self.cache is not None and not self.cassette.replaying:
+            # Record below the LLM cache, so cache hits are not timed as LLM calls
+            return CachedStructuredChain(prompt, self.llm, schema, self.cache, limiter=self.limiter,
+                                         cassette=self.cassette)
+        chain = self._create_live_chain(prompt, schema)
+        if self.cassette is not None:
+            return CassetteChain(prompt, chain, schema, self.cassette, limiter=self.limiter)
+        return chain
+
+    def _create_live_chain(self, prompt, schema):
+        if self.cache is not None:
+            return CachedStructuredChain(prompt, self.llm, schema, self.cache, limiter=self.limiter)
+        chain = (prompt | self.llm.with_structured_output(schema)).with_config(callbacks=[token_usage_callback])
+        if self.limiter is not None:
+            return LimitedChain(chain, self.limiter)
+        return chain
+
     def create_weekly_planner(self):
         # Weekly Schedule LLM planner -> given user description, generate weekly planner 
-       return ChatPromptTemplate.from_messages([
-            ("system", PLANNER_SYSTEM_PROMPT)]) | self.llm.with_structured_output(WeeklySummary)
+        return self._create_chain(PLANNER_SYSTEM_PROMPT, WeeklySummary)
 
     def create_daily_scheduler(self):
-        return ChatPromptTemplate.from_messages([
-        ('system' , SCHEDULER_SYSTEM_PROMPT)]) | self.llm.with_structured_output(DailyPlan) 
+        return self._create_chain(SCHEDULER_SYSTEM_PROMPT, DailyPlan)
 
 # Overture POI finders  -> given the weekly planner (Location, Activities), use web to find the most relevant POI points using overture and web? 
 
@@ -1,12 +1,22 @@
 from langgraph.graph import Graph 
 import os
+import asyncio
 import dotenv
 from langgraph.graph import END, START, StateGraph 
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+import aiosqlite
 from nodes import Nodes
 from edges import Edges
 from graphstate import WeeklyPlannerState 
+from utils.cache import SQLiteCache
+from utils.geocoder import GeocodeCache
+from utils.gazetteer import LocalPOIBackend
+from utils.route_cache import RouteCache
+from utils.limiter import ConcurrencyLimiter
+from utils.cassette import Cassette
+from utils.metrics import metrics
 from langchain_openai import ChatOpenAI
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, AsyncIterator
 import pandas as pd
 import pydeck as pdk
 from enum import Enum
@@ -28,7 +38,8 @@ def create_mobility_visualization(
     travel_mode: List[str],
     schedule_df: pd.DataFrame,
     trip_color: TripColors = TripColors.BLUE,
-    zoom: int = 11
+    zoom: int = 11,
+    timestamps: Optional[List[List[float]]] = None
 ) -> pdk.Deck:
     """
     Create an interactive mobility visualization using PyDeck.
@@ -43,6 +54,7 @@ def create_mobility_visualization(
         center_lat: Center latitude for the view
         center_lon: Center longitude for the view
         zoom: Initial zoom level
+        timestamps: Optional per-vertex minutes for each route, animates the trips
     
     Returns:
         pdk.Deck: PyDeck visualization object
@@ -54,6 +66,8 @@ def create_mobility_visualization(
         'day': day,
         'travel_mode': travel_mode
     })
+    if timestamps is not None:
+        df['timestamps'] = timestamps
 
     # Process day mapping and coordinates
     df['day'] = df['day'].map({
@@ -69,6 +83,7 @@ def create_mobility_visualization(
         "TripsLayer",
         df,
         get_path="coordinates",
+        get_timestamps="timestamps" if timestamps is not None else None,
         get_color=trip_color.value,
         opacity=0.8,
         width_min_pixels=4,
@@ -136,25 +151,243 @@ def create_mobility_visualization(
     )
 
 class App:
-    def __init__(self, llm):
-        self.nodes = Nodes(llm)
-        self.edges = Edges()
+    def __init__(self, llm, parallel: bool = False, max_concurrency: Optional[int] = None,
+                 llm_cache: Optional[SQLiteCache] = None, geocode_cache: Optional[GeocodeCache] = None,
+                 max_poi_retries: int = 2, pipelined_routing: bool = False,
+                 local_poi_backend: Optional[LocalPOIBackend] = None, default_poi_backend: str = 'google',
+                 route_cache: Optional[RouteCache] = None, route_simplify_metres: Optional[float] = None,
+                 llm_limiter: Optional[ConcurrencyLimiter] = None, checkpoint_path: Optional[str] = None,
+                 cassette: Optional[Cassette] = None):
+        """
+        Args:
+            llm: Language model used by the planner and scheduler agents
+            parallel: Generate all daily plans concurrently instead of one day per loop
+            max_concurrency: Cap on graph tasks run at once (e.g. concurrent day branches)
+            llm_cache: Optional persistent cache for planner and scheduler responses
+            geocode_cache: Optional persistent cache for POI lookups
+            max_poi_retries: Times a failed POI lookup is retried after the week is planned
+            pipelined_routing: Route each day inside the graph as soon as its POIs are resolved
+            local_poi_backend: Optional offline gazetteer, selected per run with
+                ``config={"configurable": {"poi_backend": "local"}}``
+            default_poi_backend: POI backend for runs that do not choose one
+            route_cache: Optional persistent cache for legs routed inside the graph
+            route_simplify_metres: Douglas-Peucker tolerance for legs routed inside the graph
+            llm_limiter: Optional cap on concurrent LLM calls shared by every run
+            checkpoint_path: Optional SQLite file the graph checkpoints every step to, keyed by
+                ``config={"configurable": {"thread_id": run_id}}``; a failed run resumes from
+                its last completed step when run again with the same thread_id
+            cassette: Optional cassette recording or replaying LLM, place and route calls
+        """
+        self.nodes = Nodes(llm, llm_cache=llm_cache, geocode_cache=geocode_cache,
+                           max_poi_retries=max_poi_retries, pipelined_routing=pipelined_routing,
+                           local_poi_backend=local_poi_backend, default_poi_backend=default_poi_backend,
+                           route_cache=route_cache, route_simplify_metres=route_simplify_metres,
+                           llm_limiter=llm_limiter, cassette=cassette)
+        self.edges = Edges(max_poi_retries=max_poi_retries, pipelined_routing=pipelined_routing)
+        self.pipelined_routing = pipelined_routing
+        self.parallel = parallel
+        self.max_concurrency = max_concurrency
+        self.checkpoint_path = checkpoint_path
+        self.checkpointer = None
+        self.graph = None
+
+    def compile(self):
+        """Build and compile the workflow once; later calls reuse the compiled graph."""
+        if self.graph is None:
+            self.graph = self.setup()
+        return self.graph
+
+    async def warm_up(self):
+        """Open the checkpointer, compile the graph, validate its topology and open the pooled HTTP session."""
+        await self.open_checkpointer()
+        graph = self.compile()
+        graph.get_graph()
+        await self.nodes.google_api_client.open()
+        return graph
+
+    async def close(self):
+        await self.nodes.google_api_client.close()
+        if self.checkpointer is not None:
+            await self.checkpointer.conn.close()
+            self.checkpointer = None
+            self.graph = None
+
+    async def open_checkpointer(self):
+        """Connect the SQLite checkpointer on the running loop; the graph is recompiled to use it."""
+        if self.checkpoint_path and self.checkpointer is None:
+            self.checkpointer = AsyncSqliteSaver(await aiosqlite.connect(self.checkpoint_path))
+            await self.checkpointer.setup()
+            self.graph = None
+
+    async def checkpoint(self, run_id: str):
+        """
+        Latest checkpoint of a run as a StateSnapshot, or None without one. ``snapshot.next``
+        names the nodes still to run and is empty once the graph has finished.
+        """
+        if self.checkpointer is None:
+            return None
+        snapshot = await self.compile().aget_state({"configurable": {"thread_id": run_id}})
+        return snapshot if snapshot.values else None
+
+    async def delete_run(self, run_id: str):
+        """Drop a run's checkpoints once its trace has been delivered."""
+        if self.checkpointer is not None:
+            await self.checkpointer.adelete_thread(run_id)
+
+    def stage(self, name, node):
+        """Wrap a node so its wall time is recorded as workflow stage ``name``."""
+        return metrics.timed('workflow_stage_seconds', stage=name)(node)
+
     def setup(self):
+        app = self.setup_parallel() if self.parallel else self.setup_sequential()
+        if self.max_concurrency:
+            app = app.with_config(max_concurrency=self.max_concurrency)
+        return app
+
+    def setup_parallel(self):
+        workflow = StateGraph(WeeklyPlannerState)
+        #Nodes
+        workflow.add_node('CreateWeeklySummary', self.stage('CreateWeeklySummary', self.nodes.create_weekly_summary))
+        workflow.add_node('CreateDayPlan', self.stage('CreateDayPlan', self.nodes.create_day_plan))
+        workflow.add_node('JoinDailyPlans', self.stage('JoinDailyPlans', self.nodes.join_daily_plans))
+        workflow.add_node('RetryPOIs', self.stage('RetryPOIs', self.nodes.retry_failed_pois))
+        workflow.add_node('RouteFinder', self.stage('RouteFinder', self.nodes.find_routes))
+
+        # Edges: map CreateDayPlan over weekly_plan.days, then join in day order
+        workflow.add_edge(START, 'CreateWeeklySummary')
+        workflow.add_conditional_edges('CreateWeeklySummary', self.edges.fan_out_days, ['CreateDayPlan'])
+        workflow.add_edge('CreateDayPlan', 'JoinDailyPlans')
+        workflow.add_conditional_edges('JoinDailyPlans', self.edges.retry_edge)
+        workflow.add_conditional_edges('RetryPOIs', self.edges.retry_edge)
+        workflow.add_edge('RouteFinder', END)
+        return workflow.compile(checkpointer=self.checkpointer)
+
+    def setup_sequential(self):
         workflow = StateGraph(WeeklyPlannerState)
         #Nodes 
-        workflow.add_node('CreateWeeklySummary', self.nodes.create_weekly_summary)
-        workflow.add_node('CreateDailyPlan', self.nodes.create_daily_plan)
-        workflow.add_node('POIFinder', self.nodes.find_relevant_pois) 
+        workflow.add_node('CreateWeeklySummary', self.stage('CreateWeeklySummary', self.nodes.create_weekly_summary))
+        workflow.add_node('CreateDailyPlan', self.stage('CreateDailyPlan', self.nodes.create_daily_plan))
+        workflow.add_node('POIFinder', self.stage('POIFinder', self.nodes.find_relevant_pois)) 
+        workflow.add_node('RetryPOIs', self.stage('RetryPOIs', self.nodes.retry_failed_pois))
+        workflow.add_node('RouteFinder', self.stage('RouteFinder', self.nodes.find_routes))
 
         # Edges
         workflow.add_edge(START, 'CreateWeeklySummary')
         workflow.add_edge('CreateWeeklySummary', 'CreateDailyPlan')
         workflow.add_edge('CreateDailyPlan', 'POIFinder')
         workflow.add_conditional_edges('POIFinder', self.edges.routing_edge)
-        app = workflow.compile()
+        workflow.add_conditional_edges('RetryPOIs', self.edges.retry_edge)
+        workflow.add_edge('RouteFinder', END)
+        app = workflow.compile(checkpointer=self.checkpointer)
         return app 
 
     
+    async def stream_trace(self, client, inputs, config=None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run the workflow and yield frames as soon as each piece is ready.
+
+        Frames are ``{'event': ..., 'data': ...}`` dicts: ``weekly_summary`` once,
+        ``daily_plan`` for each day with its POIs resolved and ``routes`` for each day's
+        decoded legs, routed in the background while later days are still planned.
+        When RetryPOIs updates a day, its plan and routes are sent again and the later
+        frames supersede the earlier ones. With pipelined routing the routes come from
+        the graph's RouteFinder runs. A final ``done`` frame closes the stream.
+
+        With ``inputs=None`` the run resumes from its checkpoint: the summary, plans and
+        routes it already holds are sent first, then the frames of the steps still to run.
+        """
+        queue = asyncio.Queue()
+        # Day index -> task routing the day's latest plan
+        route_tasks = {}
+        routed_days = set()
+        # Last plan and routes sent per day; a resumed graph replays the writes of day
+        # branches that finished before the failure, which the checkpoint already holds
+        sent = {}
+
+        async def route_day(day_index, plan):
+            stats = {}
+            routes, time, day, travel_mode, timestamps, distances = await client.compute_day_routes(plan, day_index, stats)
+            routed_days.add(day_index)
+            await queue.put({'event': 'routes', 'data': {
+                'day': day_index, 'routes': routes, 'time': time, 'travel_mode': travel_mode,
+                'timestamps': timestamps, 'distances': distances, 'stats': stats
+            }})
+
+        async def emit_plan(day_index, plan):
+            data = {'day': day_index, 'plan': plan.model_dump(mode='json')}
+            if sent.get(('daily_plan', day_index)) == data:
+                return
+            sent[('daily_plan', day_index)] = data
+            await queue.put({'event': 'daily_plan', 'data': data})
+            if not self.pipelined_routing:
+                # A plan RetryPOIs sent again supersedes the one still being routed, whose
+                # routes could otherwise reach the client last
+                if day_index in route_tasks:
+                    route_tasks[day_index].cancel()
+                route_tasks[day_index] = asyncio.create_task(route_day(day_index, plan))
+
+        async def emit_routes(day_routes):
+            for day_index, routes in (day_routes or {}).items():
+                data = {
+                    'day': day_index, 'routes': routes['routes'], 'time': routes['time'],
+                    'travel_mode': routes['travel_mode'], 'timestamps': routes['timestamps'],
+                    'distances': routes.get('distances'), 'stats': routes.get('stats', {})
+                }
+                if sent.get(('routes', day_index), {}).get('routes') == data['routes']:
+                    continue
+                sent[('routes', day_index)] = data
+                routed_days.add(day_index)
+                await queue.put({'event': 'routes', 'data': data})
+
+        async def emit_checkpoint():
+            values = (await self.compile().aget_state(config)).values
+            if values.get('weekly_plan') is not None:
+                await queue.put({'event': 'weekly_summary', 'data': values['weekly_plan'].model_dump(mode='json')})
+            # Day branches of the parallel graph store resolved plans; the sequential graph
+            # has resolved the POIs of the days before current_day_index
+            resolved = len(values.get('plans') or []) if self.parallel else values.get('current_day_index', 0)
+            for day_index, plan in enumerate((values.get('plans') or [])[:resolved]):
+                if plan is not None:
+                    await emit_plan(day_index, plan)
+            await emit_routes(values.get('day_routes'))
+
+        async def run_graph():
+            try:
+                if inputs is None:
+                    await emit_checkpoint()
+                try:
+                    async for update in self.compile().astream(inputs, config=config):
+                        for node, values in update.items():
+                            if not values:
+                                continue
+                            if 'weekly_plan' in values:
+                                await queue.put({'event': 'weekly_summary', 'data': values['weekly_plan'].model_dump(mode='json')})
+                            # Plans emitted by these nodes carry resolved POIs, keyed by day index
+                            if node in ('POIFinder', 'CreateDayPlan', 'RetryPOIs') and isinstance(values.get('plans'), dict):
+                                for day_index, plan in values['plans'].items():
+                                    await emit_plan(day_index, plan)
+                            await emit_routes(values.get('day_routes'))
+                except Exception:
+                    # The graph failed: still deliver the routes of the days already planned,
+                    # which are not checkpointed when routing runs outside the graph
+                    await asyncio.gather(*route_tasks.values(), return_exceptions=True)
+                    raise
+                await asyncio.gather(*route_tasks.values())
+                await queue.put({'event': 'done', 'data': {'routed_days': len(routed_days)}})
+            finally:
+                await queue.put(None)
+
+        runner = asyncio.create_task(run_graph())
+        try:
+            while (frame := await queue.get()) is not None:
+                yield frame
+            await runner
+        finally:
+            # Client went away or the run failed: stop any remaining work
+            for task in [runner, *route_tasks.values()]:
+                if not task.done():
+                    task.cancel()
+
     def save_plans_to_pandas(self,traces):
         # Import pandas
         import pandas as pd
@@ -192,10 +425,29 @@ class App:
 
 
 
-    def post_process_traces(self,client,traces):   
+    async def post_process_traces(self,client,traces,stats=None):   
+        """Build the schedule DataFrame and the week's routes; routing stats go into ``stats``."""
         traces = [trace for trace in traces if 'current_day_index' in trace]
         traces = [trace for trace in traces if 'plans' in trace]
-        schedule_df = self.save_plans_to_pandas(traces)
-        routes, time, day, travel_mode = client.compute_routes(traces)
+        with metrics.timer('workflow_stage_seconds', stage='save_plans_to_pandas'):
+            schedule_df = self.save_plans_to_pandas(traces)
+        day_routes = traces[-1].get('day_routes') if traces else None
+        if day_routes and len(day_routes) == len(traces[-1]['plans']):
+            # Pipelined run: every day was routed inside the graph, merge them in day order
+            routes, time, day, travel_mode, timestamps, distances = [], [], [], [], [], []
+            for day_index in sorted(day_routes):
+                routes += day_routes[day_index]['routes']
+                time += day_routes[day_index]['time']
+                day += day_routes[day_index]['day']
+                travel_mode += day_routes[day_index]['travel_mode']
+                timestamps += day_routes[day_index]['timestamps']
+                # Days checkpointed before distances were kept have none
+                distances += day_routes[day_index].get('distances') or [None] * len(day_routes[day_index]['routes'])
+                if stats is not None:
+                    for key, value in day_routes[day_index].get('stats', {}).items():
+                        stats[key] = stats.get(key, 0) + value
+        else:
+            with metrics.timer('workflow_stage_seconds', stage='compute_routes'):
+                routes, time, day, travel_mode, timestamps, distances = await client.compute_routes(traces, stats)
 
-        return schedule_df, routes, time, day, travel_mode
\ No newline at end of file
+        return schedule_df, routes, time, day, travel_mode, timestamps, distances
\ No newline at end of file
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Set
+import os
+import sys
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+from utils.cache import make_cache_key
+from utils.metrics import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def persona_id_for(persona: Dict[str, Any], position: int) -> str:
+    """
+    Stable id for a persona without one, so a rerun of the same file can skip it once
+    done. The position in the input file keeps personas sharing a description apart.
+    """
+    return persona.get('persona_id') or make_cache_key(position, persona['user_description'])[:16]
+
+
+def load_personas(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Read personas lazily from a file.
+
+    ``.jsonl``: one object per line with ``user_description`` and optionally
+    ``persona_id`` and ``poi_backend``; ``.json``: a list of such objects or strings;
+    anything else: one description per non-empty line.
+    """
+    with open(path) as f:
+        if path.endswith('.json'):
+            for item in json.load(f):
+                yield item if isinstance(item, dict) else {'user_description': item}
+            return
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            yield json.loads(line) if path.endswith('.jsonl') else {'user_description': line}
+
+
+def completed_persona_ids(path: str) -> Set[str]:
+    """Persona ids already written successfully to a results file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run
+                continue
+            if record.get('status') == 'ok':
+                done.add(record['persona_id'])
+    return done
+
+
+class BatchRunner:
+    """
+    Generates traces for many personas with a bounded number in flight.
+
+    ``concurrency`` caps personas running at once; LLM and Google calls are further
+    bounded process-wide by the LLM limiter and the HTTP pool, so raising it mostly
+    keeps those limits saturated. Results are yielded (and appended to ``output_path``
+    as JSON lines) in completion order, so memory stays flat over long runs.
+    """
+
+    def __init__(self, run_trace: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                 concurrency: int = 8, output_path: Optional[str] = None):
+        """
+        Args:
+            run_trace: Coroutine generating one persona's trace from its input dict
+            concurrency: Personas processed at once
+            output_path: Optional JSON lines file results are appended to
+        """
+        self.run_trace = run_trace
+        self.concurrency = concurrency
+        self.output_path = output_path
+
+    async def _run_one(self, persona: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            result = await self.run_trace(persona)
+            record = {'persona_id': persona['persona_id'], 'status': 'ok', 'result': result}
+        except Exception as e:
+            logger.error(f"Persona {persona['persona_id']} failed: {str(e)}")
+            record = {'persona_id': persona['persona_id'], 'status': 'error', 'error': str(e)}
+        record['seconds'] = round(time.perf_counter() - start, 3)
+        metrics.inc('batch_personas_total', status=record['status'])
+        return record
+
+    async def run(self, personas: Iterable[Dict[str, Any]], skip: Optional[Set[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Run every persona not in ``skip`` and yield one record per persona as it finishes."""
+        skip = skip or set()
+        pending = enumerate(personas)
+        seen = set()
+        results = asyncio.Queue()
+
+        async def worker():
+            # Workers pull personas lazily, so a 10k-line file is never fully materialised
+            for position, persona in pending:
+                persona = {**persona, 'persona_id': persona_id_for(persona, position)}
+                # Ids key the output, exports and checkpoints, so two personas must never share one
+                if persona['persona_id'] in seen:
+                    raise ValueError(f"Duplicate persona_id {persona['persona_id']!r} at position {position}")
+                seen.add(persona['persona_id'])
+                if persona['persona_id'] in skip:
+                    continue
+                await results.put(await self._run_one(persona))
+
+        async def supervise():
+            try:
+                await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+            finally:
+                await results.put(None)
+
+        supervisor = asyncio.create_task(supervise())
+        output = open(self.output_path, 'a') if self.output_path else None
+        try:
+            while (record := await results.get()) is not None:
+                if output is not None:
+                    output.write(json.dumps(record) + "\n")
+                    output.flush()
+                yield record
+            # Surface errors raised outside _run_one, e.g. by a malformed input line
+            await supervisor
+        finally:
+            supervisor.cancel()
+            if output is not None:
+                output.close()
+
+
+async def main(args) -> None:
+    # Build the service's clients, caches and workflow without the web app and its job store
+    from service import UserInput, build_service
+    from utils.cassette import Cassette, parse_latency
+    from utils.export import TraceExporter
+    from utils.http_pool import http_pool
+    from utils.limiter import llm_limiter
+
+    cassette = Cassette(
+        args.cassette,
+        mode=args.cassette_mode,
+        latency=parse_latency(args.cassette_latency),
+        latency_scale=args.cassette_latency_scale,
+    ) if args.cassette else None
+    service = build_service(
+        cassette=cassette,
+        checkpoint_path=args.checkpoint_path,
+        exporter=TraceExporter(args.export_dir) if args.export_dir else None,
+    )
+    # Set the limits before warm_up opens the HTTP session
+    http_pool.configure(limit=args.google_concurrency)
+    llm_limiter.configure(args.llm_concurrency)
+
+    async def run_trace(persona: Dict[str, Any]) -> Dict[str, Any]:
+        # Runs are checkpointed under the persona id, so a persona that failed part-way
+        # continues from its last completed day when the batch is run again
+        persona = {**persona, 'run_id': persona.get('run_id') or persona['persona_id']}
+        return await service.run_mobility_trace(UserInput(**persona), 'batch')
+
+    skip = completed_persona_ids(args.output) if args.resume else set()
+    if skip:
+        logger.info(f"Skipping {len(skip)} personas already in {args.output}")
+
+    await service.workflow.warm_up()
+    runner = BatchRunner(run_trace, concurrency=args.concurrency, output_path=args.output)
+    start, counts = time.perf_counter(), {'ok': 0, 'error': 0}
+    try:
+        async for record in runner.run(load_personas(args.personas), skip=skip):
+            counts[record['status']] += 1
+            done = counts['ok'] + counts['error']
+            if done % args.log_every == 0:
+                rate = done / (time.perf_counter() - start)
+                logger.info(f"{done} personas ({counts['error']} failed), {rate * 3600:.0f} per hour")
+    finally:
+        await service.close()
+    logger.info(f"Finished: {counts['ok']} ok, {counts['error']} failed in {time.perf_counter() - start:.0f}s")
+    stages = metrics.summary().get('workflow_stage_seconds', {})
+    for stage, timing in sorted(stages.items(), key=lambda item: -item[1]['seconds']):
+        logger.info(f"  {stage}: {timing['count']} calls, {timing['seconds']:.2f}s total, "
+                    f"{timing['seconds'] / timing['count'] * 1000:.1f} ms mean, {timing['max'] * 1000:.1f} ms max")
+
+
+if __name__ == '__main__':
+    import argparse
+    import dotenv
+    dotenv.load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Generate mobility traces for a population of personas")
+    parser.add_argument('personas', help="Personas as .jsonl, .json or one description per line")
+    parser.add_argument('-o', '--output', default='traces.jsonl', help="JSON lines file results are appended to")
+    parser.add_argument('--concurrency', type=int, default=16, help="Personas in flight")
+    parser.add_argument('--llm-concurrency', type=int, default=16, help="Concurrent LLM calls across all personas")
+    parser.add_argument('--google-concurrency', type=int, default=32, help="Concurrent Places/Routes calls")
+    parser.add_argument('--export-dir', help="Also export schedules and routes as Parquet under this directory")
+    parser.add_argument('--resume', action='store_true', help="Skip personas already completed in --output")
+    parser.add_argument('--checkpoint-path', help="Checkpoint file runs resume from (default CHECKPOINT_PATH)")
+    parser.add_argument('--log-every', type=int, default=50)
+    parser.add_argument('--cassette', help="Record LLM, place and route calls to this file, or replay them")
+    parser.add_argument('--cassette-mode', choices=['record', 'replay'], default='replay')
+    parser.add_argument('--cassette-latency', help="Fixed replay delays, e.g. llm=1.5,places=0.05,routes=0.1")
+    parser.add_argument('--cassette-latency-scale', type=float, default=1.0,
+                        help="Multiplier on recorded durations, 0 to measure orchestration overhead alone")
+    asyncio.run(main(parser.parse_args()))
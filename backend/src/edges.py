@@ -1,11 +1,54 @@
 from langgraph.graph import END
-from typing import Literal
+from langgraph.types import Send
+from typing import List, Literal, Union
 from graphstate import WeeklyPlannerState 
 class Edges:
-    @staticmethod
-    async def routing_edge(state: WeeklyPlannerState) -> Literal[END, 'CreateDailyPlan']:
-        if state['current_day_index'] == 7:
-            return END
+    def __init__(self, max_poi_retries: int = 2, pipelined_routing: bool = False):
+        self.max_poi_retries = max_poi_retries
+        self.pipelined_routing = pipelined_routing
+
+    async def routing_edge(self, state: WeeklyPlannerState) -> Union[Literal[END, 'CreateDailyPlan', 'RetryPOIs'], List]:
+        if state['current_day_index'] >= len(state['weekly_plan'].days):
+            next_step = await self.retry_edge(state)
         else:
-            return 'CreateDailyPlan'
+            next_step = 'CreateDailyPlan'
+        if self.pipelined_routing and next_step in ('CreateDailyPlan', 'RetryPOIs'):
+            # Route the day POIFinder just resolved alongside the next step, unless its
+            # POIs still wait on the retry stage
+            day_index = state['current_day_index'] - 1
+            failures = state.get('poi_failures') or []
+            if not any(failure['day'] == day_index for failure in failures):
+                return [next_step] + self.route_days(state, [day_index])
+        return next_step
+
+    async def retry_edge(self, state: WeeklyPlannerState) -> Union[Literal[END, 'RetryPOIs'], List[Send]]:
+        failures = state.get('poi_failures') or []
+        if any(failure['attempts'] <= self.max_poi_retries for failure in failures):
+            return 'RetryPOIs'
+        if self.pipelined_routing:
+            # POIs are final: route every day that has not been routed yet
+            routed = state.get('day_routes') or {}
+            unrouted = [day_index for day_index in range(len(state['plans'])) if day_index not in routed]
+            if unrouted:
+                return self.route_days(state, unrouted)
+        return END
 
+    @staticmethod
+    def route_days(state: WeeklyPlannerState, days: List[int]) -> List[Send]:
+        """Dispatch one RouteFinder run per day index."""
+        return [
+            Send('RouteFinder', {'plans': state['plans'], 'current_day_index': day_index})
+            for day_index in days
+        ]
+
+    @staticmethod
+    def fan_out_days(state: WeeklyPlannerState) -> List[Send]:
+        """Dispatch one CreateDayPlan branch per day of the weekly summary."""
+        return [
+            Send('CreateDayPlan', {
+                'user_description': state['user_description'],
+                'weekly_plan': state['weekly_plan'],
+                'current_day_index': day_index,
+            })
+            for day_index in range(len(state['weekly_plan'].days))
+        ]
@@ -1,18 +1,43 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
-from app import App, create_mobility_visualization
-from langchain_openai import ChatOpenAI
-from utils.agent_tools import GoogleAPIClient
+from typing import Optional, Dict, Any, List, Callable
+from app import create_mobility_visualization
+from batch import BatchRunner
+from jobs import JobQueue, JobStore, DONE, trace_progress
+from service import UserInput, build_service
+from utils.http_pool import http_pool
+from utils.metrics import metrics
+from utils.deckgl import encode_trips
+from contextlib import asynccontextmanager
+import json
+import logging
 import os
+import time
+import uuid
 import dotenv
 from fastapi.middleware.cors import CORSMiddleware
 
 # Load environment variables
 dotenv.load_dotenv()
 
+
+@asynccontextmanager
+async def lifespan(api: FastAPI):
+    # Compile the LangGraph workflow once and reuse it for every request
+    start = time.perf_counter()
+    await workflow.warm_up()
+    compile_seconds = time.perf_counter() - start
+    metrics.observe('workflow_compile_seconds', compile_seconds)
+    logging.info(f"Workflow compiled and warmed up in {compile_seconds:.3f}s")
+    job_queue.start()
+    yield
+    await job_queue.stop()
+    await service.close()
+
+
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -23,44 +48,185 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize clients
-client = GoogleAPIClient(os.getenv('GOOGLE_API_KEY'))
-llm = ChatOpenAI(model_name="gpt-4", temperature=0.7)
-workflow = App(llm)
+# Initialize clients, caches and the workflow
+service = build_service()
+workflow, client, exporter = service.workflow, service.client, service.exporter
+llm_cache, geocode_cache, route_cache = service.llm_cache, service.geocode_cache, service.route_cache
+
+
+async def run_mobility_trace(user_input: UserInput, endpoint: str,
+                             on_state: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    return await service.run_mobility_trace(user_input, endpoint, on_state=on_state)
 
-class UserInput(BaseModel):
-    user_description: str
-    current_day_index: int = 0
-    plans: Optional[Any] = None
 
 @app.post("/generate-mobility-trace")
 async def generate_mobility_trace(user_input: UserInput):
     try:
-        config = {"recursion_limit": 50}
-        traces = []
-        
-        # Process the workflow
-        async for event in workflow.setup().astream(user_input.dict(), config=config):
-            for k, v in event.items():
-                if k != "__end__":
-                    traces.append(v)
-        
-        # Post-process traces
-        schedule_df, routes, time, day, travel_mode = workflow.post_process_traces(
-            client, traces
-        )
-        
-        return {
-            'schedule_df': schedule_df.to_dict(orient='records'),
-            'routes': routes,
-            'time': time,
-            'day': day,
-            'travel_mode': travel_mode
-        }
-    
+        return await run_mobility_trace(user_input, 'generate-mobility-trace')
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/generate-mobility-trace/deck")
+async def generate_mobility_trace_deck(user_input: UserInput):
+    """Return the trace's trips as deck.gl binary attributes, see utils.deckgl.encode_trips."""
+    try:
+        trace = await run_mobility_trace(user_input, 'generate-mobility-trace/deck')
+        return Response(encode_trips([trace]), media_type="application/octet-stream",
+                        headers={'X-Persona-Id': trace['persona_id']})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+class BatchInput(BaseModel):
+    personas: List[UserInput]
+    # Personas generated at once, capped by BATCH_MAX_CONCURRENCY
+    concurrency: int = 8
+
+@app.post("/generate-mobility-trace/batch")
+async def generate_mobility_trace_batch(batch_input: BatchInput):
+    """
+    Generate traces for many personas concurrently, streaming one JSON line per persona
+    as it finishes. With BATCH_OUTPUT_DIR set, the lines are also appended to
+    ``<BATCH_OUTPUT_DIR>/<batch_id>.jsonl``.
+    """
+    batch_id = uuid.uuid4().hex
+    output_dir = os.getenv('BATCH_OUTPUT_DIR')
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    runner = BatchRunner(
+        lambda persona: run_mobility_trace(UserInput(**persona), 'batch'),
+        concurrency=max(1, min(batch_input.concurrency, int(os.getenv('BATCH_MAX_CONCURRENCY', '16')))),
+        output_path=os.path.join(output_dir, f"{batch_id}.jsonl") if output_dir else None,
+    )
+
+    async def lines():
+        async for record in runner.run(persona.dict() for persona in batch_input.personas):
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={'X-Batch-Id': batch_id})
+
+async def run_job(inputs: Dict[str, Any], on_progress: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    progress = {}
+
+    def on_state(state):
+        progress.update(trace_progress(state))
+        on_progress(progress)
+
+    # Checkpointed under the job's run id, so a job re-queued after a restart resumes
+    result = await run_mobility_trace(UserInput(**inputs), 'jobs', on_state=on_state)
+    progress['legs_routed'] = result['routing_stats'].get('legs', len(result['routes']))
+    on_progress(progress)
+    return result
+
+# Background jobs; the SQLite file keeps queued jobs and results across restarts
+job_queue = JobQueue(
+    JobStore(os.getenv('JOBS_PATH', 'jobs.sqlite')),
+    run_job,
+    workers=int(os.getenv('JOB_WORKERS', '4')),
+)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(user_input: UserInput):
+    """Queue a trace generation and return its job id immediately."""
+    job_id = job_queue.submit({**user_input.dict(), 'run_id': user_input.run_id or uuid.uuid4().hex})
+    return {'job_id': job_id, 'status': job_queue.store.get(job_id)['status']}
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Status and progress (days planned, POIs resolved, days and legs routed) of a job."""
+    job = job_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = job_queue.store.get(job_id, with_result=True)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job['status'] != DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return job['result']
+
+@app.post("/generate-mobility-trace/stream")
+async def stream_mobility_trace(user_input: UserInput, format: str = "sse"):
+    """
+    Stream the weekly summary, each day's plan and each day's routes as they are ready,
+    as Server-Sent Events (default) or newline-delimited JSON (``format=ndjson``).
+    """
+    run_id = user_input.run_id or uuid.uuid4().hex
+    config = user_input.graph_config(run_id)
+
+    async def frames():
+        try:
+            with metrics.run_scope() as run_metrics, http_pool.request_scope():
+                checkpoint = await workflow.checkpoint(run_id)
+                if checkpoint is not None and not checkpoint.next:
+                    # A finished run would merge a new one into its state
+                    await workflow.delete_run(run_id)
+                    checkpoint = None
+                graph_input = None if checkpoint is not None else user_input.graph_input()
+                async for frame in workflow.stream_trace(client, graph_input, config=config):
+                    if frame['event'] == 'done':
+                        frame['data']['metrics'] = run_metrics.summary()
+                    if format == "ndjson":
+                        yield json.dumps(frame) + "\n"
+                    else:
+                        yield f"event: {frame['event']}\ndata: {json.dumps(frame['data'])}\n\n"
+            await workflow.delete_run(run_id)
+        except Exception as e:
+            logging.error(f"Error streaming mobility trace: {str(e)}")
+            error = {'event': 'error', 'data': {'detail': str(e)}}
+            yield json.dumps(error) + "\n" if format == "ndjson" else f"event: error\ndata: {json.dumps(error['data'])}\n\n"
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/event-stream"
+    return StreamingResponse(frames(), media_type=media_type, headers={'X-Run-Id': run_id})
+
+@app.get("/runs/{run_id}")
+async def run_status(run_id: str):
+    """Checkpointed progress of a run that failed or is still going; 404 once delivered or unknown."""
+    checkpoint = await workflow.checkpoint(run_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail="No checkpoint for this run")
+    return {
+        'run_id': run_id,
+        'next': list(checkpoint.next),
+        'progress': trace_progress(checkpoint.values),
+        'updated_at': checkpoint.created_at,
+    }
+
+@app.post("/runs/{run_id}/resume")
+async def resume_run(run_id: str):
+    """Continue a failed or interrupted run from its last checkpoint and return its trace."""
+    checkpoint = await workflow.checkpoint(run_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail="No checkpoint for this run")
+    user_input = UserInput(
+        user_description=checkpoint.values['user_description'],
+        poi_backend=checkpoint.metadata.get('poi_backend'),
+        run_id=run_id,
+    )
+    try:
+        return await run_mobility_trace(user_input, 'resume')
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/stats")
+async def stats():
+    return metrics.snapshot()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Process-wide metrics in the Prometheus text format."""
+    return Response(metrics.prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/cache-stats")
+async def cache_stats():
+    return {
+        'llm': llm_cache.stats() if llm_cache is not None else None,
+        'geocode': geocode_cache.stats() if geocode_cache is not None else None,
+        'routes': route_cache.stats() if route_cache is not None else None,
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
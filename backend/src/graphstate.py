@@ -5,13 +5,72 @@ import sys
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 import operator
-from typing import Annotated, List, Tuple
-from typing_extensions import TypedDict
+from typing import Annotated, Dict, List, Optional, Tuple
+from typing_extensions import NotRequired, TypedDict
 from model.output_classes import WeeklySummary, dayofweek, DailyPlan
 
+class POILookupFailure(TypedDict):
+    day: int
+    entry: int
+    attempts: int
+    resolved: NotRequired[bool]
+
+
+def update_plans(current: Optional[List[DailyPlan]], update) -> List[DailyPlan]:
+    """Reducer for ``plans``: nodes emit only the days they produced or changed.
+
+    A list of plans is appended; a ``{day_index: plan}`` dict replaces those days
+    (padding with None until concurrent day branches have all reported).
+    """
+    plans = list(current or [])
+    if update is None:
+        return plans
+    if isinstance(update, dict):
+        for day_index, plan in sorted(update.items()):
+            if day_index >= len(plans):
+                plans.extend([None] * (day_index + 1 - len(plans)))
+            plans[day_index] = plan
+        return plans
+    return plans + list(update)
+
+
+def update_poi_failures(current: Optional[List[POILookupFailure]], update) -> List[POILookupFailure]:
+    """Reducer for ``poi_failures``: merge by (day, entry), dropping resolved lookups."""
+    failures = {(failure['day'], failure['entry']): failure for failure in current or []}
+    for failure in update or []:
+        key = (failure['day'], failure['entry'])
+        if failure.get('resolved'):
+            failures.pop(key, None)
+        else:
+            failures[key] = failure
+    return list(failures.values())
+
+
+class DayRoutes(TypedDict):
+    routes: list
+    time: List[int]
+    day: List[int]
+    travel_mode: List[str]
+    # Per-vertex minutes since midnight for each route, see GoogleAPIClient.route_legs
+    timestamps: List[List[float]]
+    # Metres of each leg, 0 for stays, see GoogleAPIClient.route_legs
+    distances: List[Optional[int]]
+    # Leg counts and Routes API calls saved by local stays, see GoogleAPIClient.route_legs
+    stats: Dict[str, int]
+
+
+def update_day_routes(current: Optional[Dict[int, DayRoutes]], update) -> Dict[int, DayRoutes]:
+    """Reducer for ``day_routes``: each RouteFinder run adds or replaces its day."""
+    return {**(current or {}), **(update or {})}
+
+
 class WeeklyPlannerState(TypedDict):
     user_description: str
     weekly_plan: WeeklySummary
     current_day_index: int = 0
     daily_agenda: str 
-    plans: list[DailyPlan] 
+    plans: Annotated[list[DailyPlan], update_plans]
+    # POI lookups that returned nothing, retried by the RetryPOIs stage
+    poi_failures: Annotated[List[POILookupFailure], update_poi_failures]
+    # Pipelined mode: routes of each day, computed as soon as its POIs are final
+    day_routes: Annotated[Dict[int, DayRoutes], update_day_routes]
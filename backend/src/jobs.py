@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import os
+import sys
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+from utils.metrics import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+def trace_progress(state: Dict[str, Any]) -> Dict[str, int]:
+    """Days planned, POIs resolved and days routed so far in a workflow state."""
+    plans = [plan for plan in state.get('plans') or [] if plan is not None]
+    entries = [entry for plan in plans for entry in plan.entries]
+    return {
+        'days_planned': len(plans),
+        'pois_total': len(entries),
+        'pois_resolved': sum(entry.poi_output is not None for entry in entries),
+        'days_routed': len(state.get('day_routes') or {}),
+    }
+
+
+class JobStore:
+    """SQLite table of jobs with their input, progress, result and error, kept across restarts."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    input TEXT NOT NULL,
+                    progress TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            self._conn.commit()
+
+    def create(self, inputs: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, input, progress, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(inputs), '{}', now, now),
+            )
+            self._conn.commit()
+        return job_id
+
+    def update(self, job_id: str, **fields) -> None:
+        """Set any of status, progress, result and error; dict values are stored as JSON."""
+        fields = {key: json.dumps(value) if key in ('progress', 'result') else value for key, value in fields.items()}
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{key} = ?" for key in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def get(self, job_id: str, with_result: bool = False) -> Optional[Dict[str, Any]]:
+        columns = 'id, status, input, progress, error, created_at, updated_at' + (', result' if with_result else '')
+        with self._lock:
+            row = self._conn.execute(f"SELECT {columns} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            'id': row[0], 'status': row[1], 'input': json.loads(row[2]), 'progress': json.loads(row[3]),
+            'error': row[4], 'created_at': row[5], 'updated_at': row[6],
+        }
+        if with_result:
+            job['result'] = json.loads(row[7]) if row[7] is not None else None
+        return job
+
+    def unfinished(self) -> List[str]:
+        """Queued jobs and jobs a previous process was running when it stopped, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+class JobQueue:
+    """
+    Runs workflow jobs on a bounded pool of asyncio workers.
+
+    ``run_job(inputs, on_progress)`` produces a job's JSON-serialisable result and may
+    call ``on_progress(dict)`` as it goes. Jobs outlive the request that submitted them;
+    on ``start`` any job left queued or running by a previous process is picked up again.
+    """
+
+    def __init__(self, store: JobStore,
+                 run_job: Callable[[Dict[str, Any], Callable[[Dict[str, Any]], None]], Awaitable[Any]],
+                 workers: int = 4):
+        """
+        Args:
+            store: Persistent job table
+            run_job: Coroutine function running one job
+            workers: Jobs executed at once
+        """
+        self.store = store
+        self.run_job = run_job
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        resumed = self.store.unfinished()
+        for job_id in resumed:
+            self._queue.put_nowait(job_id)
+        if resumed:
+            logger.info(f"Re-queued {len(resumed)} unfinished jobs")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, inputs: Dict[str, Any]) -> str:
+        job_id = self.store.create(inputs)
+        self._queue.put_nowait(job_id)
+        metrics.inc('jobs_submitted_total')
+        return job_id
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            job = self.store.get(job_id)
+            if job is None or job['status'] in (DONE, FAILED):
+                continue
+            self.store.update(job_id, status=RUNNING)
+
+            def on_progress(progress: Dict[str, Any], job_id=job_id) -> None:
+                self.store.update(job_id, progress=progress)
+
+            try:
+                result = await self.run_job(job['input'], on_progress)
+                self.store.update(job_id, status=DONE, result=result)
+                metrics.inc('jobs_finished_total', status=DONE)
+            except asyncio.CancelledError:
+                # Shutting down: leave the job "running" so the next start picks it up
+                raise
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {str(e)}")
+                self.store.update(job_id, status=FAILED, error=str(e))
+                metrics.inc('jobs_finished_total', status=FAILED)
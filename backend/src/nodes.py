@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 import logging
 import os
 import sys
@@ -7,9 +7,17 @@ from pathlib import Path
 # Go to the root of the project
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
-from graphstate import WeeklyPlannerState 
+from graphstate import WeeklyPlannerState, POILookupFailure, DayRoutes
 from model.agents import agent_creator 
 from utils.agent_tools import GoogleAPIClient
+from utils.cache import SQLiteCache
+from utils.geocoder import GeocodeCache
+from utils.gazetteer import LocalPOIBackend
+from utils.route_cache import RouteCache
+from utils.limiter import ConcurrencyLimiter
+from utils.metrics import metrics
+from utils.cassette import Cassette
+from langchain_core.runnables import RunnableConfig
 import dotenv
 import asyncio
 dotenv.load_dotenv()
@@ -18,17 +26,39 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class Nodes:
-    def __init__(self, llm) -> None:
+    def __init__(self, llm, llm_cache: Optional[SQLiteCache] = None,
+                 geocode_cache: Optional[GeocodeCache] = None, max_poi_retries: int = 2,
+                 pipelined_routing: bool = False, local_poi_backend: Optional[LocalPOIBackend] = None,
+                 default_poi_backend: str = 'google', route_cache: Optional[RouteCache] = None,
+                 route_simplify_metres: Optional[float] = None,
+                 llm_limiter: Optional[ConcurrencyLimiter] = None, cassette: Optional[Cassette] = None) -> None:
         """Initialize Nodes with language model and required agents.
         
         Args:
             llm: Language model instance
+            llm_cache: Optional persistent cache for planner and scheduler responses
+            geocode_cache: Optional persistent cache for POI lookups
+            max_poi_retries: Times a failed POI lookup is retried by RetryPOIs
+            pipelined_routing: Route each day as soon as its POIs are resolved
+            local_poi_backend: Optional offline gazetteer used when a run selects "local"
+            default_poi_backend: POI backend for runs that do not choose one
+            route_cache: Optional persistent cache for routed legs
+            route_simplify_metres: Optional tolerance for simplifying routed legs
+            llm_limiter: Optional process-wide cap on concurrent LLM calls
+            cassette: Optional cassette recording or replaying LLM, place and route calls
         """
         try:
-            self.agent_creator = agent_creator(llm)
+            self.max_poi_retries = max_poi_retries
+            self.pipelined_routing = pipelined_routing
+            self.local_poi_backend = local_poi_backend
+            self.default_poi_backend = default_poi_backend
+            self.agent_creator = agent_creator(llm, cache=llm_cache, limiter=llm_limiter, cassette=cassette)
             self.weekly_planner = self.agent_creator.create_weekly_planner()
             self.daily_scheduler = self.agent_creator.create_daily_scheduler()
-            self.google_api_client = GoogleAPIClient(os.getenv('GOOGLE_API_KEY'))
+            self.google_api_client = GoogleAPIClient(
+                os.getenv('GOOGLE_API_KEY'), geocode_cache=geocode_cache, route_cache=route_cache,
+                simplify_metres=route_simplify_metres, cassette=cassette
+            )
         except Exception as e:
             logger.error(f"Failed to initialize Nodes: {str(e)}")
             raise
@@ -47,9 +77,8 @@ class Nodes:
             current_day_index = state['current_day_index']
             current_day_agenda = state['weekly_plan'].days[current_day_index].summary 
             daily_plan = await self.daily_scheduler.ainvoke({"daily_agenda": current_day_agenda,"user_description": state['user_description']})
-            plans = [daily_plan] if state['plans'] is None else state['plans'] + [daily_plan]
             return {
-                "plans": plans,
+                "plans": [daily_plan],
                 "daily_agenda": current_day_agenda
             }
 
@@ -57,8 +86,36 @@ class Nodes:
             logger.error(f"Error creating daily plan: {str(e)}")
             raise
 
-    async def find_relevant_pois(self, state: WeeklyPlannerState) -> Dict[str, Any]:
-        """Find points of interest relevant to the weekly plan concurrently.
+    def place_backend(self, config: Optional[RunnableConfig] = None):
+        """Return the place lookup backend selected for this run ("google" or "local")."""
+        name = ((config or {}).get('configurable') or {}).get('poi_backend') or self.default_poi_backend
+        if name == 'local':
+            if self.local_poi_backend is None:
+                raise ValueError("The local POI backend was requested but no gazetteer is loaded")
+            return self.local_poi_backend
+        if name != 'google':
+            raise ValueError(f"Unknown POI backend: {name}")
+        return self.google_api_client
+
+    @metrics.timed('workflow_stage_seconds', stage='resolve_pois')
+    async def resolve_pois(self, day_index: int, plan, config: Optional[RunnableConfig] = None) -> List[POILookupFailure]:
+        """Resolve the POIs of one daily plan and return the lookups that failed."""
+        results = await self.place_backend(config).get_places_info(
+            [entry.poi_category + ", " + entry.location for entry in plan.entries]
+        )
+        failures = []
+        for entry_index, (entry, result) in enumerate(zip(plan.entries, results)):
+            entry.poi_output = result
+            if result is None:
+                failures.append(POILookupFailure(day=day_index, entry=entry_index, attempts=1))
+        return failures
+
+    async def find_relevant_pois(self, state: WeeklyPlannerState, config: RunnableConfig) -> Dict[str, Any]:
+        """Find points of interest for the newly planned day concurrently.
+
+        Only the entries of ``plans[current_day_index]`` are looked up; failed lookups
+        are recorded in ``poi_failures`` for the RetryPOIs stage instead of being
+        re-queued on every later day.
         
         Args:
             state: Current weekly planner state
@@ -68,33 +125,104 @@ class Nodes:
         """
         try:
             current_day_index = state['current_day_index']
+            plan = state['plans'][current_day_index]
+            failures = await self.resolve_pois(current_day_index, plan, config)
+            return {
+                "plans": {current_day_index: plan},
+                "current_day_index": current_day_index + 1,
+                "poi_failures": failures,
+            }
+        except Exception as e:
+            logger.error(f"Error finding POIs: {str(e)}")
+            raise
+
+    async def retry_failed_pois(self, state: WeeklyPlannerState, config: RunnableConfig) -> Dict[str, Any]:
+        """Retry failed POI lookups that have attempts left.
+
+        Lookups are retried at most ``max_poi_retries`` times; exhausted failures stay
+        in ``poi_failures`` so callers can report them.
+        """
+        try:
             plans = state['plans']
-            
-            # Create list of POI lookups needed
-            poi_lookups = []
-            for plan in plans:
-                for entry in plan.entries:
-                    if entry.poi_output is None:
-                        poi_lookups.append((
-                            entry,
-                            entry.poi_category + ", " + entry.location
-                        ))
-            
-            # Execute POI lookups concurrently using aiohttp
-            client = GoogleAPIClient(self.google_api_client.api_key)
-            results = []
-            for _, address in poi_lookups:
-                result = client.get_place_info(address)
-                results.append(result)
-                
-            # Assign results back to entries
-            for (entry, _), result in zip(poi_lookups, results):
+            failures = state.get('poi_failures') or []
+            retry = [failure for failure in failures if failure['attempts'] <= self.max_poi_retries]
+
+            entries = [plans[failure['day']].entries[failure['entry']] for failure in retry]
+            # Bypass the geocode cache, which holds the "no candidates" answer being retried
+            results = await self.place_backend(config).get_places_info(
+                [entry.poi_category + ", " + entry.location for entry in entries], refresh=True
+            )
+            updates = []
+            for failure, entry, result in zip(retry, entries, results):
                 entry.poi_output = result
-                    
-            return {"plans": plans, "current_day_index": current_day_index + 1}
+                updates.append(POILookupFailure(
+                    day=failure['day'], entry=failure['entry'], attempts=failure['attempts'] + 1,
+                    resolved=result is not None,
+                ))
+            unresolved = sum(not update['resolved'] for update in updates)
+            logger.info(f"Retried {len(retry)} POI lookups, {unresolved} still unresolved")
+            return {
+                "plans": {failure['day']: plans[failure['day']] for failure in retry},
+                "poi_failures": updates,
+            }
         except Exception as e:
-            logger.error(f"Error finding POIs: {str(e)}")
+            logger.error(f"Error retrying POIs: {str(e)}")
             raise
+
+    async def create_day_plan(self, state: WeeklyPlannerState, config: RunnableConfig) -> Dict[str, Any]:
+        """Create the plan for a single day and resolve its POIs.
+
+        Used by the parallel workflow, where ``Edges.fan_out_days`` dispatches
+        one branch per day with ``current_day_index`` set to that day.
+
+        Args:
+            state: Branch state holding the user description, weekly plan and day index
+
+        Returns:
+            Dictionary containing this day's plan keyed by its day index
+        """
+        try:
+            day_index = state['current_day_index']
+            day_agenda = state['weekly_plan'].days[day_index].summary
+            daily_plan = await self.daily_scheduler.ainvoke({"daily_agenda": day_agenda, "user_description": state['user_description']})
+
+            failures = await self.resolve_pois(day_index, daily_plan, config)
+            update = {"plans": {day_index: daily_plan}, "poi_failures": failures}
+            if self.pipelined_routing and not failures:
+                # Days with failed lookups are routed once the retry stage is done
+                update["day_routes"] = {day_index: await self.compute_day_routes(day_index, daily_plan)}
+            return update
+        except Exception as e:
+            logger.error(f"Error creating plan for day {state.get('current_day_index')}: {str(e)}")
+            raise
+
+    @metrics.timed('workflow_stage_seconds', stage='compute_day_routes')
+    async def compute_day_routes(self, day_index: int, plan) -> DayRoutes:
+        stats = {}
+        routes, time, day, travel_mode, timestamps, distances = await self.google_api_client.compute_day_routes(
+            plan, day_index, stats
+        )
+        return DayRoutes(routes=routes, time=time, day=day, travel_mode=travel_mode, timestamps=timestamps,
+                         distances=distances, stats=stats)
+
+    async def find_routes(self, state: WeeklyPlannerState) -> Dict[str, Any]:
+        """Route the legs of one day while the rest of the week is still being planned.
+
+        Dispatched by ``Edges.route_days`` with ``current_day_index`` set to the day.
+        """
+        try:
+            day_index = state['current_day_index']
+            return {"day_routes": {day_index: await self.compute_day_routes(day_index, state['plans'][day_index])}}
+        except Exception as e:
+            logger.error(f"Error finding routes for day {state.get('current_day_index')}: {str(e)}")
+            raise
+
+    async def join_daily_plans(self, state: WeeklyPlannerState) -> Dict[str, Any]:
+        """Synchronise the parallel day branches once every day has been planned.
+
+        The ``plans`` reducer already placed each branch's plan at its day index.
+        """
+        return {"current_day_index": len(state['plans'])}
     
 if __name__ == "__main__":
     from langchain_openai import ChatOpenAI
@@ -118,7 +246,7 @@ if __name__ == "__main__":
             #Update state
             new_state = new_state.copy()
             new_state['plans'] = daily_plan['plans']
-            relevant_pois = await nodes.find_relevant_pois(new_state)
+            relevant_pois = await nodes.find_relevant_pois(new_state, {})
             logger.info(f"Relevant POIs created: {relevant_pois}")
         except Exception as e:
             logger.error(f"Main execution failed: {str(e)}")
@@ -0,0 +1,192 @@
+from pydantic import BaseModel
+from typing import Optional, Dict, Any, Callable
+from app import App
+from langchain_openai import ChatOpenAI
+from utils.agent_tools import GoogleAPIClient
+from utils.cache import SQLiteCache
+from utils.geocoder import GeocodeCache
+from utils.gazetteer import LocalPOIBackend
+from utils.route_cache import RouteCache
+from utils.http_pool import http_pool
+from utils.limiter import llm_limiter
+from utils.metrics import metrics
+from utils.export import TraceExporter
+from utils.cassette import Cassette, parse_latency
+import asyncio
+import logging
+import os
+import uuid
+
+
+class UserInput(BaseModel):
+    user_description: str
+    current_day_index: int = 0
+    plans: Optional[Any] = None
+    # "google" or "local" (offline gazetteer); defaults to DEFAULT_POI_BACKEND
+    poi_backend: Optional[str] = None
+    # Identifies the persona in exported datasets; generated when not given
+    persona_id: Optional[str] = None
+    # Checkpoint key; sending a failed run's id again resumes it instead of starting over
+    run_id: Optional[str] = None
+
+    def graph_input(self) -> Dict[str, Any]:
+        return self.dict(exclude={'poi_backend', 'persona_id', 'run_id'})
+
+    def graph_config(self, run_id: Optional[str] = None) -> Dict[str, Any]:
+        return {"recursion_limit": 50, "configurable": {"poi_backend": self.poi_backend, "thread_id": run_id}}
+
+
+class TraceService:
+    """
+    The clients, caches and compiled workflow behind a trace run, shared by the web
+    service and the batch CLI. Build one with ``build_service``.
+    """
+
+    def __init__(self, workflow: App, client: GoogleAPIClient, llm_cache: Optional[SQLiteCache] = None,
+                 geocode_cache: Optional[GeocodeCache] = None, route_cache: Optional[RouteCache] = None,
+                 cassette: Optional[Cassette] = None, exporter: Optional[TraceExporter] = None):
+        self.workflow = workflow
+        self.client = client
+        self.llm_cache = llm_cache
+        self.geocode_cache = geocode_cache
+        self.route_cache = route_cache
+        self.cassette = cassette
+        self.exporter = exporter
+
+    async def close(self) -> None:
+        await self.workflow.close()
+        if self.exporter is not None:
+            self.exporter.close()
+
+    async def run_mobility_trace(self, user_input: UserInput, endpoint: str,
+                                 on_state: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Run the workflow for one persona and return its schedule, routes and routing stats.
+        ``on_state`` is called with the accumulated state after every graph step. A run whose
+        ``run_id`` has an unfinished checkpoint resumes from it rather than starting over.
+        """
+        workflow = self.workflow
+        run_id = user_input.run_id or uuid.uuid4().hex
+        config = user_input.graph_config(run_id)
+        traces = []
+        routing_stats = {}
+
+        with metrics.run_scope() as run_metrics, metrics.timer('request_seconds', endpoint=endpoint), \
+                http_pool.request_scope():
+            checkpoint = await workflow.checkpoint(run_id)
+            if checkpoint is not None and not checkpoint.next:
+                # The graph finished before post-processing failed; reuse its state
+                traces.append(checkpoint.values)
+            else:
+                if checkpoint is not None:
+                    logging.info(f"Resuming run {run_id} at {', '.join(checkpoint.next)}")
+                    metrics.inc('runs_resumed_total', endpoint=endpoint)
+                graph_input = None if checkpoint is not None else user_input.graph_input()
+                # Process the workflow; nodes emit deltas, so collect the accumulated state
+                async for state in workflow.compile().astream(graph_input, config=config, stream_mode="values"):
+                    traces.append(state)
+                    if on_state is not None:
+                        on_state(state)
+
+            # Post-process traces
+            schedule_df, routes, time, day, travel_mode, timestamps, distances = await workflow.post_process_traces(
+                self.client, traces, routing_stats
+            )
+
+        persona_id = user_input.persona_id or uuid.uuid4().hex
+        if self.exporter is not None:
+            await asyncio.to_thread(
+                self.exporter.write, persona_id, traces[-1]['plans'], routes, time, day, travel_mode, timestamps,
+                distances
+            )
+        await workflow.delete_run(run_id)
+
+        return {
+            'run_id': run_id,
+            'persona_id': persona_id,
+            'schedule_df': schedule_df.to_dict(orient='records'),
+            'routes': routes,
+            'time': time,
+            'day': day,
+            'travel_mode': travel_mode,
+            'timestamps': timestamps,
+            'distances': distances,
+            'routing_stats': routing_stats,
+            # Stage timings, LLM tokens, Google calls and bytes, and cache lookups of this run
+            'metrics': run_metrics.summary(),
+        }
+
+
+def build_service(cassette: Optional[Cassette] = None, checkpoint_path: Optional[str] = None,
+                  exporter: Optional[TraceExporter] = None) -> TraceService:
+    """
+    Build the clients, caches and workflow from the environment. ``cassette``,
+    ``checkpoint_path`` and ``exporter`` replace the ones the environment configures.
+    """
+    # All Places and Routes calls share one HTTP pool and its limits
+    http_pool.configure(
+        limit=int(os.getenv('HTTP_POOL_LIMIT', '32')),
+        per_request_limit=int(os.getenv('HTTP_PER_REQUEST_LIMIT', '10')),
+    )
+    route_cache = RouteCache(
+        os.getenv('ROUTE_CACHE_PATH', 'route_cache.sqlite'),
+        grid_metres=float(os.getenv('ROUTE_CACHE_GRID_METRES', '25')),
+        max_entries=int(os.getenv('ROUTE_CACHE_MAX_ENTRIES', '100000')),
+    ) if os.getenv('ROUTE_CACHE', 'true').lower() == 'true' else None
+    # Douglas-Peucker tolerance applied to decoded routes; unset keeps every vertex
+    route_simplify_metres = float(os.getenv('ROUTE_SIMPLIFY_METRES')) if os.getenv('ROUTE_SIMPLIFY_METRES') else None
+    # Cap on concurrent LLM calls across every request and batch persona
+    llm_limiter.configure(int(os.getenv('LLM_MAX_CONCURRENCY', '16')))
+    # Record LLM, place and route calls to a cassette, or replay one offline with synthetic latency
+    if cassette is None and os.getenv('CASSETTE_PATH'):
+        cassette = Cassette(
+            os.getenv('CASSETTE_PATH'),
+            mode=os.getenv('CASSETTE_MODE', 'replay'),
+            latency=parse_latency(os.getenv('CASSETTE_LATENCY')),
+            latency_scale=float(os.getenv('CASSETTE_LATENCY_SCALE', '1')),
+        )
+    if cassette is not None and cassette.replaying:
+        # Replays never reach OpenAI, but the client refuses to construct without a key
+        os.environ.setdefault('OPENAI_API_KEY', 'cassette-replay')
+    client = GoogleAPIClient(os.getenv('GOOGLE_API_KEY'), route_cache=route_cache,
+                             simplify_metres=route_simplify_metres, cassette=cassette)
+    llm = ChatOpenAI(model_name="gpt-4", temperature=0.7)
+    llm_cache = SQLiteCache(
+        os.getenv('LLM_CACHE_PATH', 'llm_cache.sqlite'),
+        namespace='llm',
+        max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', '10000')),
+        ttl=float(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 3600))),
+    ) if os.getenv('LLM_CACHE', 'true').lower() == 'true' else None
+    geocode_cache = GeocodeCache(
+        os.getenv('GEOCODE_CACHE_PATH', 'geocode_cache.sqlite'),
+        ttl=float(os.getenv('GEOCODE_CACHE_TTL_SECONDS', str(30 * 24 * 3600))),
+        negative_ttl=float(os.getenv('GEOCODE_CACHE_NEGATIVE_TTL_SECONDS', str(24 * 3600))),
+    ) if os.getenv('GEOCODE_CACHE', 'true').lower() == 'true' else None
+    if checkpoint_path is None and os.getenv('CHECKPOINTS', 'true').lower() == 'true':
+        # Per-run checkpoints let a failed or interrupted run resume from its last completed step
+        checkpoint_path = os.getenv('CHECKPOINT_PATH', 'checkpoints.sqlite')
+    workflow = App(
+        llm,
+        parallel=os.getenv('PARALLEL_DAILY_PLANS', 'true').lower() == 'true',
+        max_concurrency=int(os.getenv('MAX_DAILY_PLAN_CONCURRENCY', '7')),
+        llm_cache=llm_cache,
+        geocode_cache=geocode_cache,
+        max_poi_retries=int(os.getenv('MAX_POI_RETRIES', '2')),
+        pipelined_routing=os.getenv('PIPELINED_ROUTING', 'true').lower() == 'true',
+        local_poi_backend=LocalPOIBackend(os.getenv('LOCAL_POI_PATH')) if os.getenv('LOCAL_POI_PATH') else None,
+        default_poi_backend=os.getenv('DEFAULT_POI_BACKEND', 'google'),
+        route_cache=route_cache,
+        route_simplify_metres=route_simplify_metres,
+        llm_limiter=llm_limiter,
+        checkpoint_path=checkpoint_path,
+        cassette=cassette,
+    )
+    # Optional Parquet/Arrow export of every generated persona-week
+    if exporter is None and os.getenv('TRACE_EXPORT_DIR'):
+        exporter = TraceExporter(
+            os.getenv('TRACE_EXPORT_DIR'),
+            format=os.getenv('TRACE_EXPORT_FORMAT', 'parquet'),
+            personas_per_file=int(os.getenv('TRACE_EXPORT_PERSONAS_PER_FILE', '100')),
+        )
+    return TraceService(workflow, client, llm_cache=llm_cache, geocode_cache=geocode_cache, route_cache=route_cache,
+                        cassette=cassette, exporter=exporter)
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import sys
+import polyline
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+from model.output_classes import POI
+from utils.agent_tools import GoogleAPIClient
+
+HOME = POI(name='Home', latitude=51.5413, longitude=0.0031, address='Stratford')
+OFFICE = POI(name='Office', latitude=51.4907, longitude=-0.2065, address='West Kensington')
+# About 20 m from the office
+OFFICE_CAFE = POI(name='Cafe', latitude=51.4908, longitude=-0.2063, address='West Kensington')
+
+
+def make_client(delay=0.0):
+    """A client whose Routes API calls are answered locally and recorded."""
+    client = GoogleAPIClient('test-key')
+    client.calls = []
+
+    async def get_route(origin, destination, travel_mode):
+        client.calls.append((origin.name, destination.name, travel_mode))
+        await asyncio.sleep(delay)
+        line = polyline.encode([(origin.latitude, origin.longitude), (destination.latitude, destination.longitude)])
+        return {'routes': [{'duration': '1200s', 'distanceMeters': 15000, 'polyline': {'encodedPolyline': line}}]}
+
+    client._get_route_async = get_route
+    return client
+
+
+def test_classify_leg():
+    client = make_client()
+    assert client.classify_leg(None, OFFICE, 'WALK') == 'unresolved'
+    assert client.classify_leg(HOME, None, 'WALK') == 'unresolved'
+    assert client.classify_leg(OFFICE, OFFICE_CAFE, 'WALK') == 'stay'
+    assert client.classify_leg(HOME, OFFICE, 'NONE') == 'route'
+
+
+def test_route_legs_places_unresolved_legs_as_none():
+    client = make_client()
+    legs = [(HOME, None, 'TRANSIT'), (None, OFFICE, 'TRANSIT'), (HOME, OFFICE, 'TRANSIT')]
+    stats = {}
+    routes, timestamps, distances = asyncio.run(client.route_legs(legs, [540, 600, 660], stats))
+    assert routes[:2] == [None, None] and timestamps[:2] == [None, None] and distances[:2] == [None, None]
+    assert routes[2] is not None and distances[2] == 15000
+    assert client.calls == [('Home', 'Office', 'TRANSIT')]
+    assert stats['unresolved_legs'] == 2 and stats['routed_legs'] == 1 and stats['duplicate_legs'] == 0
+
+
+def test_route_legs_routes_none_mode_as_walk_and_skips_stays():
+    client = make_client()
+    legs = [(OFFICE, OFFICE_CAFE, 'NONE'), (OFFICE, HOME, 'NONE')]
+    routes, timestamps, distances = asyncio.run(client.route_legs(legs, [720, 1080]))
+    assert client.calls == [('Office', 'Home', 'WALK')]
+    assert routes[0] == [[OFFICE.longitude, OFFICE.latitude]] * 2
+    assert timestamps[0] == [720, 720] and distances[0] == 0
+    assert len(routes[1]) == 2
+
+
+def test_route_legs_fetches_repeated_legs_once():
+    client = make_client()
+    legs = [(HOME, OFFICE, 'TRANSIT'), (OFFICE, HOME, 'TRANSIT'), (HOME, OFFICE, 'TRANSIT')]
+    stats = {}
+    routes, timestamps, distances = asyncio.run(client.route_legs(legs, [540, 1080, 1980], stats))
+    assert sorted(client.calls) == [('Home', 'Office', 'TRANSIT'), ('Office', 'Home', 'TRANSIT')]
+    assert routes[2] == routes[0] and routes[2] is not routes[0]
+    assert stats['duplicate_legs'] == 1 and stats['api_calls_saved'] == 1
+
+
+def test_leg_timestamps_arrive_at_the_scheduled_minute():
+    client = make_client()
+    _, timestamps, _ = asyncio.run(client.route_legs([(HOME, OFFICE, 'TRANSIT')], [540]))
+    assert timestamps[0][0] == 520 and timestamps[0][-1] == 540
+
+
+def test_concurrent_route_legs_share_in_flight_requests():
+    client = make_client(delay=0.05)
+
+    async def route_days():
+        # Two day branches routing the same commute at the same time
+        return await asyncio.gather(*(client.route_legs([(HOME, OFFICE, 'TRANSIT')], [540]) for _ in range(2)))
+
+    first, second = asyncio.run(route_days())
+    assert client.calls == [('Home', 'Office', 'TRANSIT')]
+    assert first[0] == second[0]
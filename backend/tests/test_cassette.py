@@ -0,0 +1,82 @@
+import asyncio
+import json
+import os
+import sys
+import pytest
+from langchain_core.runnables import RunnableLambda
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+from model.agents import agent_creator
+from model.output_classes import DailySummary, WeeklySummary, dayofweek
+from utils.cache import SQLiteCache
+from utils.cassette import Cassette, CassetteMiss
+
+LLM_SECONDS = 0.05
+
+
+class FakeLLM:
+    """Structured-output LLM answering every prompt with the same week after a delay."""
+    model_name = 'fake'
+    temperature = 0
+
+    def __init__(self):
+        self.calls = 0
+
+    def with_structured_output(self, schema):
+        def answer(_):
+            self.calls += 1
+            return WeeklySummary(days=[DailySummary(day=day, summary='work') for day in dayofweek])
+
+        async def answer_async(prompt_value):
+            await asyncio.sleep(LLM_SECONDS)
+            return answer(prompt_value)
+
+        return RunnableLambda(answer, afunc=answer_async)
+
+
+def plan(path, mode, cache=None, llm=None, **kwargs):
+    cassette = Cassette(path, mode=mode, **kwargs)
+    return agent_creator(llm or FakeLLM(), cache=cache, cassette=cassette).create_weekly_planner()
+
+
+def recorded(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_replay_returns_recording_without_the_llm(tmp_path):
+    path = str(tmp_path / 'cassette.jsonl')
+    live = asyncio.run(plan(path, 'record').ainvoke({'user_description': 'nurse'}))
+    llm = FakeLLM()
+    replayed = asyncio.run(plan(path, 'replay', llm=llm, latency_scale=0).ainvoke({'user_description': 'nurse'}))
+    assert replayed == live and llm.calls == 0
+    with pytest.raises(CassetteMiss):
+        asyncio.run(plan(path, 'replay', latency_scale=0).ainvoke({'user_description': 'teacher'}))
+
+
+def test_llm_cache_hits_are_recorded_without_a_duration(tmp_path):
+    cache = SQLiteCache(':memory:', namespace='llm')
+    cold, warm = str(tmp_path / 'cold.jsonl'), str(tmp_path / 'warm.jsonl')
+    asyncio.run(plan(cold, 'record', cache=cache).ainvoke({'user_description': 'nurse'}))
+    assert recorded(cold)[0]['seconds'] >= LLM_SECONDS
+    llm = FakeLLM()
+    asyncio.run(plan(warm, 'record', cache=cache, llm=llm).ainvoke({'user_description': 'nurse'}))
+    assert llm.calls == 0
+    assert [record['seconds'] for record in recorded(warm)] == [None]
+
+
+def test_cache_hits_replay_at_the_mean_live_duration(tmp_path):
+    path = str(tmp_path / 'cassette.jsonl')
+    cassette = Cassette(path, mode='record')
+    cassette.record('llm', 'live', 'a', 2.0)
+    cassette.record('llm', 'hit', 'b', None)
+    # A later live call for the same request fills in the duration
+    cassette.record('llm', 'other', 'c', None)
+    cassette.record('llm', 'other', 'c', 4.0)
+    cassette.record('llm', 'other', 'c', None)
+    assert [record['key'] for record in recorded(path)] == ['live', 'hit', 'other', 'other']
+
+    replay = Cassette(path, mode='replay', latency_scale=0.5)
+    assert replay.delay('llm', replay.lookup('llm', 'live')) == 1.0
+    assert replay.delay('llm', replay.lookup('llm', 'hit')) == 1.5
+    assert replay.delay('llm', replay.lookup('llm', 'other')) == 2.0
@@ -0,0 +1,27 @@
+import os
+import sys
+import numpy as np
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+from utils.deckgl import decode_trips, encode_trips
+
+
+def make_trace(lng):
+    return {'routes': [[[lng, 51.5], [lng, 51.51]], None], 'time': [540, 600], 'day': ['Monday', 'Monday'],
+            'timestamps': [[530.0, 540.0], None]}
+
+
+def test_round_trip():
+    header, arrays = decode_trips(encode_trips([make_trace(-0.1), make_trace(0.0)]))
+    assert header['length'] == 2 and header['vertexCount'] == 4
+    assert arrays['startIndices'].tolist() == [0, 2, 4]
+    assert np.allclose(arrays['positions'].reshape(-1, 2)[2], [0.0, 51.5])
+    assert arrays['timestamps'].tolist() == [530.0, 540.0, 530.0, 540.0]
+    assert arrays['trace'].tolist() == [0, 1]
+
+
+def test_trace_ids_beyond_uint16():
+    traces = [{'routes': [None], 'time': [None], 'day': [None]}] * 70000 + [make_trace(-0.1)]
+    header, arrays = decode_trips(encode_trips(traces))
+    assert header['trace']['type'] == 'uint32'
+    assert arrays['trace'].tolist() == [70000]
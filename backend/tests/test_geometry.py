@@ -0,0 +1,78 @@
+import os
+import sys
+import numpy as np
+import shapely
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+from utils.geometry import simplify_mask, simplify_routes, to_local_metres, travel_fractions
+
+# Roughly 1 m in degrees of latitude
+METRE = 1 / 111320
+
+
+def flat(routes):
+    """Back-to-back coordinates and offsets, as returned by decode_polylines."""
+    lengths = [len(route) for route in routes]
+    coords = np.array([point for route in routes for point in route], dtype=float).reshape(-1, 2)
+    return coords, np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+
+def straight_with_noise(n, noise_metres, seed=0):
+    rng = np.random.default_rng(seed)
+    lngs = np.linspace(-0.1, -0.09, n)
+    lats = 51.5 + rng.uniform(-noise_metres, noise_metres, n) * METRE
+    lats[[0, -1]] = 51.5
+    return np.column_stack([lngs, lats]).tolist()
+
+
+def test_noise_below_tolerance_collapses_to_endpoints():
+    coords, offsets = flat([straight_with_noise(100, 2)])
+    keep = simplify_mask(coords, offsets, tolerance_metres=5)
+    assert np.flatnonzero(keep).tolist() == [0, 99]
+
+
+def test_corners_above_tolerance_are_kept():
+    # A 100 m zigzag
+    route = [[-0.1 + i * 0.001, 51.5 + (i % 2) * 100 * METRE] for i in range(9)]
+    coords, offsets = flat([route])
+    assert simplify_mask(coords, offsets, tolerance_metres=10).all()
+
+
+def test_endpoints_of_every_route_are_kept():
+    routes = [straight_with_noise(50, 20, seed) for seed in range(3)]
+    routes += [[[-0.1, 51.5]], [], straight_with_noise(2, 0)]
+    coords, offsets = flat(routes)
+    kept, kept_offsets, keep = simplify_routes(coords, offsets, tolerance_metres=10)
+    assert len(kept_offsets) == len(offsets) and kept_offsets[-1] == len(kept) == keep.sum()
+    for route, start, end in zip(routes, kept_offsets[:-1], kept_offsets[1:]):
+        simplified = kept[start:end].tolist()
+        if not route:
+            assert simplified == []
+        else:
+            assert simplified[0] == route[0] and simplified[-1] == route[-1]
+            assert len(simplified) <= len(route)
+
+
+def test_vertex_count_shrinks_with_tolerance():
+    coords, offsets = flat([straight_with_noise(200, 30, seed) for seed in range(5)])
+    counts = [simplify_mask(coords, offsets, tolerance).sum() for tolerance in (1, 10, 50)]
+    assert counts[0] >= counts[1] >= counts[2] == 10
+
+
+def test_dropped_vertices_lie_within_tolerance():
+    coords, offsets = flat([straight_with_noise(300, 25)])
+    keep = simplify_mask(coords, offsets, tolerance_metres=10)
+    xy = to_local_metres(coords)
+    simplified = shapely.LineString(xy[keep])
+    assert 2 < keep.sum() < len(coords)
+    assert shapely.distance(shapely.points(xy), simplified).max() <= 10 + 1e-6
+
+
+def test_travel_fractions_run_from_zero_to_one_per_route():
+    coords, offsets = flat([straight_with_noise(10, 0), [[-0.1, 51.5]], [[-0.1, 51.5], [-0.1, 51.5]]])
+    fractions = travel_fractions(coords, offsets)
+    first = fractions[offsets[0]:offsets[1]]
+    assert first[0] == 0 and np.isclose(first[-1], 1) and (np.diff(first) >= 0).all()
+    assert fractions[offsets[1]] == 0
+    # A zero-length route spreads evenly over its vertices
+    assert fractions[offsets[2]:offsets[3]].tolist() == [0.0, 1.0]
@@ -0,0 +1,72 @@
+import os
+import sys
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+sys.path.append(os.path.join(project_root, 'src'))
+from graphstate import update_day_routes, update_plans, update_poi_failures
+from model.output_classes import DailyPlan, ScheduleEntry, TravelMode
+
+
+def make_plan(action):
+    return DailyPlan(entries=[ScheduleEntry(time="09:00", action=action, poi_category="Office",
+                                            location="West Kensington, London", travel_mode=TravelMode.WALK,
+                                            poi_output=None)])
+
+
+def make_routes(label):
+    return {'routes': [label], 'time': [540], 'day': [0], 'travel_mode': ['WALK'], 'timestamps': [[540.0]],
+            'distances': [0], 'stats': {}}
+
+
+def test_list_updates_are_appended():
+    monday, tuesday = make_plan('Monday'), make_plan('Tuesday')
+    plans = update_plans(None, [monday])
+    assert update_plans(plans, [tuesday]) == [monday, tuesday]
+
+
+def test_none_update_keeps_plans():
+    monday = make_plan('Monday')
+    assert update_plans([monday], None) == [monday]
+    assert update_plans(None, None) == []
+
+
+def test_out_of_order_day_writes_are_padded():
+    friday, tuesday = make_plan('Friday'), make_plan('Tuesday')
+    plans = update_plans(None, {4: friday})
+    assert plans == [None, None, None, None, friday]
+    plans = update_plans(plans, {1: tuesday})
+    assert plans == [None, tuesday, None, None, friday]
+
+
+def test_dict_update_replaces_only_its_days():
+    days = [make_plan(str(index)) for index in range(3)]
+    original = list(days)
+    retried = make_plan('retried')
+    plans = update_plans(days, {1: retried})
+    assert plans == [days[0], retried, days[2]]
+    # The reducer returns a new list rather than editing the checkpointed one
+    assert [plan is before for plan, before in zip(days, original)] == [True, True, True]
+
+
+def test_failures_merge_by_day_and_entry():
+    failures = update_poi_failures(None, [{'day': 0, 'entry': 2, 'attempts': 1},
+                                          {'day': 3, 'entry': 0, 'attempts': 1}])
+    failures = update_poi_failures(failures, [{'day': 0, 'entry': 2, 'attempts': 2}])
+    assert sorted((f['day'], f['entry'], f['attempts']) for f in failures) == [(0, 2, 2), (3, 0, 1)]
+
+
+def test_resolved_retries_drop_their_failures():
+    failures = [{'day': 0, 'entry': 2, 'attempts': 1}, {'day': 3, 'entry': 0, 'attempts': 1}]
+    failures = update_poi_failures(failures, [{'day': 0, 'entry': 2, 'attempts': 2, 'resolved': True}])
+    assert failures == [{'day': 3, 'entry': 0, 'attempts': 1}]
+    # Resolving a lookup that was never recorded is a no-op
+    assert update_poi_failures(failures, [{'day': 5, 'entry': 1, 'attempts': 1, 'resolved': True}]) == failures
+
+
+def test_day_routes_add_and_replace_days():
+    routes = update_day_routes(None, {2: make_routes('a')})
+    routes = update_day_routes(routes, {0: make_routes('b')})
+    assert sorted(routes) == [0, 2]
+    routes = update_day_routes(routes, {2: make_routes('c')})
+    assert routes[2]['routes'] == ['c'] and routes[0]['routes'] == ['b']
+    assert update_day_routes(routes, None) == routes
@@ -0,0 +1,72 @@
+import os
+import sys
+import numpy as np
+import polyline
+import pytest
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+from utils.polyline_codec import decode_polyline, decode_polylines, split_routes, to_linestrings, to_lists
+
+# The worked example of Google's encoded polyline algorithm documentation
+GOOGLE_EXAMPLE = '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+GOOGLE_EXAMPLE_POINTS = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+
+
+def reference(encoded, precision=5):
+    """Decode with the polyline package, as [lng, lat] like decode_polylines."""
+    return [[lng, lat] for lat, lng in polyline.decode(encoded, precision)]
+
+
+def test_google_example():
+    assert np.allclose(decode_polyline(GOOGLE_EXAMPLE), GOOGLE_EXAMPLE_POINTS)
+
+
+def test_matches_polyline_package_on_random_routes():
+    rng = np.random.default_rng(0)
+    routes = []
+    for _ in range(50):
+        steps = rng.normal(0, 0.001, size=(int(rng.integers(1, 200)), 2))
+        routes.append(polyline.encode([(51.5 + lat, -0.1 + lng) for lat, lng in np.cumsum(steps, axis=0)]))
+    coords, offsets = decode_polylines(routes)
+    assert len(offsets) == len(routes) + 1
+    for view, encoded in zip(split_routes(coords, offsets), routes):
+        assert np.allclose(view, reference(encoded), rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('points', [
+    [(90.0, 180.0), (-90.0, -180.0)],
+    [(0.0, 0.0), (0.00001, -0.00001), (0.0, 0.0)],
+    [(-89.99999, 179.99999), (89.99999, -179.99999), (-89.99999, 179.99999)],
+])
+def test_extreme_coordinates(points):
+    encoded = polyline.encode(points)
+    assert np.allclose(decode_polyline(encoded), reference(encoded), rtol=0, atol=1e-9)
+
+
+def test_precision_six():
+    encoded = polyline.encode([(51.507351, -0.127758), (51.541301, 0.003101)], 6)
+    assert np.allclose(decode_polyline(encoded, precision=6), reference(encoded, 6), rtol=0, atol=1e-12)
+
+
+def test_empty_input():
+    coords, offsets = decode_polylines([])
+    assert coords.shape == (0, 2) and offsets.tolist() == [0]
+    coords, offsets = decode_polylines(['', ''])
+    assert coords.shape == (0, 2) and offsets.tolist() == [0, 0, 0]
+
+
+def test_empty_routes_between_others_keep_their_place():
+    routes = ['', GOOGLE_EXAMPLE, '', polyline.encode([(51.5, -0.1)]), '']
+    coords, offsets = decode_polylines(routes)
+    assert np.diff(offsets).tolist() == [0, 3, 0, 1, 0]
+    lists = to_lists(coords, offsets)
+    assert lists[0] == [] and lists[2] == [] and lists[4] == []
+    assert np.allclose(lists[1], GOOGLE_EXAMPLE_POINTS) and np.allclose(lists[3], [[-0.1, 51.5]])
+
+
+def test_linestrings_for_empty_and_single_point_routes():
+    coords, offsets = decode_polylines(['', polyline.encode([(51.5, -0.1)]), GOOGLE_EXAMPLE])
+    lines = to_linestrings(coords, offsets)
+    assert lines[0] is None
+    assert len(lines[1].coords) == 2 and lines[1].length == 0
+    assert np.allclose(np.asarray(lines[2].coords), GOOGLE_EXAMPLE_POINTS)
@@ -0,0 +1,88 @@
+import glob
+import json
+import os
+import sys
+import numpy as np
+import pytest
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+from utils.trace_codec import (assert_round_trip, decode_trace, encode_trace, unzigzag, varint_decode,
+                               varint_encode, zigzag)
+
+SAMPLE_TRACES = sorted(glob.glob(os.path.join(project_root, '..', 'deckgl-trip-layer', 'public', '*_trace.json')))
+
+
+def make_trace():
+    return {
+        'trip_layer': {
+            'routes': [[[-0.1276, 51.5072], [-0.1281, 51.5079]], [], None, [[0.0031, 51.5413]]],
+            'timestamps': [[480.0, 482.5], [], None, [1020.0]],
+            'time': [480, 540, None, 1020],
+            'day': ['Monday', 'Monday', None, 'Tuesday'],
+        },
+        'point_layer': {
+            'coordinates': [[-0.1276, 51.5072], None, [0.0031, 51.5413]],
+            'latitude': [51.5072, None, 51.5413],
+            'duration': [0.25, 1.0, None],
+            'name': ['Office', None, 'Home'],
+        },
+    }
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_round_trip(compress):
+    trace = make_trace()
+    assert_round_trip(trace, decode_trace(encode_trace(trace, compress=compress)))
+
+
+def test_uncompressed_buffer_is_readable_without_zlib():
+    encoded = encode_trace(make_trace(), compress=False)
+    assert encoded[4] == 0
+    assert decode_trace(encoded) == decode_trace(encode_trace(make_trace()))
+
+
+def test_nulls_survive_in_every_column_kind():
+    decoded = decode_trace(encode_trace(make_trace()))
+    assert decoded['trip_layer']['routes'][2] is None
+    assert decoded['trip_layer']['timestamps'][2] is None
+    assert decoded['trip_layer']['time'][2] is None
+    assert decoded['trip_layer']['day'][2] is None
+    assert decoded['point_layer']['coordinates'][1] is None
+    assert decoded['point_layer']['latitude'][1] is None
+    assert decoded['point_layer']['name'][1] is None
+
+
+def test_empty_routes_stay_empty():
+    decoded = decode_trace(encode_trace(make_trace()))
+    assert decoded['trip_layer']['routes'][1] == []
+    assert decoded['trip_layer']['timestamps'][1] == []
+    empty = {'trip_layer': {'routes': [], 'timestamps': [], 'time': []}}
+    assert decode_trace(encode_trace(empty)) == empty
+
+
+def test_float_columns_decode_as_floats():
+    decoded = decode_trace(encode_trace({'point_layer': {'latitude': [51.5]}}))
+    assert decoded == {'point_layer': {'latitude': [51.5]}}
+    durations = decode_trace(encode_trace(make_trace(), precision=2))['point_layer']['duration']
+    assert durations == [0.25, 1.0, None]
+
+
+def test_unsupported_columns_are_rejected():
+    with pytest.raises(ValueError):
+        encode_trace({'point_layer': {'visited': [True, False]}})
+    with pytest.raises(ValueError):
+        encode_trace({'point_layer': {'poi': [{'name': 'Home'}]}})
+    with pytest.raises(ValueError):
+        encode_trace({'point_layer': {'latitude': [float('nan')]}})
+
+
+def test_varints_round_trip_extremes():
+    values = np.array([0, 1, -1, 63, -64, 2 ** 31, -2 ** 31, 2 ** 62, -2 ** 62], dtype=np.int64)
+    assert unzigzag(varint_decode(varint_encode(zigzag(values)))).tolist() == values.tolist()
+
+
+@pytest.mark.parametrize('path', SAMPLE_TRACES)
+def test_sample_traces_round_trip(path):
+    with open(path) as f:
+        trace = json.load(f)
+    assert_round_trip(trace, decode_trace(encode_trace(trace)))
@@ -1,53 +1,190 @@
 import aiohttp
+import asyncio
+import json
+import math
+import numpy as np
 import requests
-import polyline
-from shapely.geometry import LineString
 import geopandas as gpd
 import logging
 import os 
 import sys  
+from urllib.parse import urlencode
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 from model.output_classes import POI
+from utils.geocoder import GeocodeCache
+from utils.route_cache import RouteCache
+from utils.http_pool import HTTPPool, http_pool
+from utils.metrics import metrics
+from utils.cassette import Cassette
+from utils.polyline_codec import decode_polyline, decode_polylines, to_linestrings, to_lists
+from utils.geometry import simplify_routes, travel_fractions
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
-class GoogleAPIClient:
-    def __init__(self, api_key):
-        self.api_key = api_key
+PLACES_URL = "https://maps.googleapis.com/maps/api/place/findplacefromtext/json"
+ROUTES_URL = "https://routes.googleapis.com/directions/v2:computeRoutes"
+# Find Place statuses that answer the query; the others (REQUEST_DENIED, OVER_QUERY_LIMIT,
+# INVALID_REQUEST, ...) also come back as HTTP 200 but say nothing about the place
+PLACES_ANSWERS = {'OK', 'ZERO_RESULTS'}
+EARTH_RADIUS_METRES = 6371008.8
 
-    def get_place_info(self, address):
+
+def parse_duration(duration) -> float:
+    """Seconds from a Routes API duration such as "1234s"."""
+    if not duration:
+        return 0.0
+    return float(str(duration).rstrip('s'))
+
+
+def haversine_metres(origin: POI, destination: POI) -> float:
+    lat1, lat2 = math.radians(origin.latitude), math.radians(destination.latitude)
+    dlat = lat2 - lat1
+    dlng = math.radians(destination.longitude - origin.longitude)
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_METRES * math.asin(math.sqrt(a))
+
+
+class GoogleAPIClient:
+    def __init__(self, api_key, geocode_cache: GeocodeCache = None, route_cache: RouteCache = None,
+                 pool: HTTPPool = None, stay_distance_metres: float = 50.0, simplify_metres: float = None,
+                 cassette: Cassette = None):
         """
-        Get place information using Google Places API.
+        Args:
+            api_key: Google Maps Platform API key
+            geocode_cache: Optional persistent cache consulted before Find Place calls
+            route_cache: Optional persistent cache consulted before Routes API calls
+            pool: HTTP pool for async calls, defaults to the process-wide pool
+            stay_distance_metres: Legs shorter than this are stays and are not routed
+            simplify_metres: Douglas-Peucker tolerance applied to routed legs, None keeps every vertex
+            cassette: Optional cassette recording or replaying every place and route lookup
         """
-        url = "https://maps.googleapis.com/maps/api/place/findplacefromtext/json"
-        params = {
+        self.api_key = api_key
+        self.geocode_cache = geocode_cache
+        self.route_cache = route_cache
+        self.pool = pool or http_pool
+        self.stay_distance_metres = stay_distance_metres
+        self.simplify_metres = simplify_metres
+        self.cassette = cassette
+        # Leg key -> task fetching it, shared by every caller until it completes
+        self._routes_in_flight = {}
+
+    def _place_params(self, address):
+        return {
             "input": address,
             "inputtype": "textquery",
             "fields": "formatted_address,name,business_status,geometry",
             "key": self.api_key,
         }
-        response = requests.get(url, params=params)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if "candidates" in data and data["candidates"]:
-                logging.info(f"Place info retrieved for {address}")
-                data = data["candidates"][0]
-                poi = POI(name=data["name"], latitude=data["geometry"]["location"]["lat"], longitude=data["geometry"]["location"]["lng"], address=data["formatted_address"])
+
+    @staticmethod
+    def _record_call(api, status, sent, received):
+        """Count one Places or Routes call with its request and response body sizes."""
+        metrics.inc('google_api_requests_total', api=api, status=status)
+        metrics.inc('google_api_bytes_total', sent, api=api, direction='sent')
+        metrics.inc('google_api_bytes_total', received, api=api, direction='received')
+
+    def _store_place(self, address, data, poi):
+        """Cache a found place, or a miss only when Places reported ZERO_RESULTS."""
+        if self.geocode_cache is not None and (poi is not None or data.get('status') == 'ZERO_RESULTS'):
+            self.geocode_cache.set(address, poi)
+
+    def _parse_place(self, address, data):
+        if "candidates" in data and data["candidates"]:
+            logging.info(f"Place info retrieved for {address}")
+            data = data["candidates"][0]
+            poi = POI(name=data["name"], latitude=data["geometry"]["location"]["lat"], longitude=data["geometry"]["location"]["lng"], address=data["formatted_address"])
+            return poi
+        else:
+            logging.warning(f"No candidates found for {address}")
+            return None
+
+    def get_place_info(self, address):
+        """
+        Get place information using Google Places API.
+        """
+        if self.cassette is not None:
+            return self.cassette.call_sync('places', address, lambda: self._get_place_info(address),
+                                           encode=POI.model_dump, decode=POI.model_validate)
+        return self._get_place_info(address)
+
+    def _get_place_info(self, address):
+        if self.geocode_cache is not None:
+            found, poi = self.geocode_cache.get(address)
+            if found:
                 return poi
-            else:
-                logging.warning(f"No candidates found for {address}")
-                return None
+        params = self._place_params(address)
+        response = requests.get(PLACES_URL, params=params)
+        data = response.json() if response.status_code == 200 else {}
+        answered = response.status_code == 200 and data.get('status', 'OK') in PLACES_ANSWERS
+        # An HTTP 200 with an error status counts as an error, not as a lookup
+        status = 'error' if response.status_code == 200 and not answered else response.status_code
+        self._record_call('places', status, len(urlencode(params)), len(response.content))
+
+        if answered:
+            poi = self._parse_place(address, data)
+            self._store_place(address, data, poi)
+            return poi
         else:
-            logging.error(f"Failed to get place info for {address}")
+            logging.error(f"Failed to get place info for {address}: {data.get('status')} {data.get('error_message', '')}")
             return None
 
-    def get_route(self, origin:POI, destination:POI,travel_mode:str):
+    async def open(self):
+        """Open the pooled session ahead of the first request."""
+        await self.pool.session()
+
+    async def close(self):
+        await self.pool.close()
+
+    async def get_place_info_async(self, address, refresh=False):
         """
-        Get route information between origin and destination using Google Routes API.
+        Get place information using Google Places API without blocking the event loop.
+        With ``refresh`` the geocode cache is not read, so a cached "no candidates"
+        answer is looked up again; the new answer is still stored.
         """
-        url = 'https://routes.googleapis.com/directions/v2:computeRoutes'
+        if self.cassette is not None:
+            return await self.cassette.call('places', address, lambda: self._get_place_info_async(address, refresh),
+                                            encode=POI.model_dump, decode=POI.model_validate, slot=self.pool.slot)
+        return await self._get_place_info_async(address, refresh)
+
+    async def _get_place_info_async(self, address, refresh=False):
+        if self.geocode_cache is not None and not refresh:
+            found, poi = self.geocode_cache.get(address)
+            if found:
+                return poi
+        session = await self.pool.session()
+        params = self._place_params(address)
+        try:
+            async with self.pool.slot():
+                async with session.get(PLACES_URL, params=params) as response:
+                    body = await response.read()
+                    data = json.loads(body) if response.status == 200 else {}
+                    answered = response.status == 200 and data.get('status', 'OK') in PLACES_ANSWERS
+                    status = 'error' if response.status == 200 and not answered else response.status
+                    self._record_call('places', status, len(urlencode(params)), len(body))
+                    if answered:
+                        poi = self._parse_place(address, data)
+                        self._store_place(address, data, poi)
+                        return poi
+                    logging.error(f"Failed to get place info for {address}: {data.get('status')} {data.get('error_message', '')}")
+                    return None
+        except aiohttp.ClientError as e:
+            metrics.inc('google_api_requests_total', api='places', status='error')
+            logging.error(f"Failed to get place info for {address}: {e}")
+            return None
+
+    async def get_places_info(self, addresses, refresh=False):
+        """Resolve many addresses concurrently, returning POIs in input order."""
+        # Look each distinct query up once, e.g. "Home, Stratford" appears several times a day
+        key = self.geocode_cache.key if self.geocode_cache is not None else (lambda address: address)
+        unique = {}
+        for address in addresses:
+            unique.setdefault(key(address), address)
+        results = await asyncio.gather(*(self.get_place_info_async(address, refresh) for address in unique.values()))
+        resolved = dict(zip(unique.keys(), results))
+        return [resolved[key(address)] for address in addresses]
+
+    def _route_request(self, origin: POI, destination: POI, travel_mode: str):
         headers = {
             'Content-Type': 'application/json',
             'X-Goog-Api-Key': self.api_key,
@@ -72,80 +209,274 @@ class GoogleAPIClient:
             "languageCode": "en-US",
             "units": "IMPERIAL"
         }
+        return headers, payload
+
+    def get_route(self, origin:POI, destination:POI,travel_mode:str):
+        """
+        Get route information between origin and destination using Google Routes API.
+        """
+        if self.cassette is not None:
+            return self.cassette.call_sync('routes', json.dumps(self.leg_key(origin, destination, travel_mode)),
+                                           lambda: self._get_route(origin, destination, travel_mode))
+        return self._get_route(origin, destination, travel_mode)
 
-        response = requests.post(url, headers=headers, json=payload)
+    def _get_route(self, origin: POI, destination: POI, travel_mode: str):
+        if self.route_cache is not None:
+            cached = self.route_cache.get(origin, destination, travel_mode)
+            if cached is not None:
+                return cached
+        headers, payload = self._route_request(origin, destination, travel_mode)
+
+        response = requests.post(ROUTES_URL, headers=headers, json=payload)
+        self._record_call('routes', response.status_code, len(response.request.body or b''), len(response.content))
         if response.status_code == 200:
             logging.info("Route successfully retrieved.")
-            return response.json()
+            route = response.json()
+            if self.route_cache is not None:
+                self.route_cache.set(origin, destination, travel_mode, route)
+            return route
         else:
             logging.error("Failed to retrieve route information.")
             return None
 
+    async def get_route_async(self, origin: POI, destination: POI, travel_mode: str):
+        """
+        Get route information using Google Routes API over the shared HTTP pool.
+
+        Concurrent requests for the same leg, e.g. the commute of day branches planned
+        in parallel, share one call: later callers wait for the first one's result
+        instead of missing the route cache it has not written yet.
+        """
+        key = self.leg_key(origin, destination, travel_mode)
+        task = self._routes_in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._request_route_async(origin, destination, travel_mode))
+            self._routes_in_flight[key] = task
+            task.add_done_callback(lambda _: self._routes_in_flight.pop(key, None))
+        else:
+            metrics.inc('google_api_coalesced_total', api='routes')
+        # A caller that goes away must not cancel the call the others are waiting for
+        return await asyncio.shield(task)
+
+    async def _request_route_async(self, origin: POI, destination: POI, travel_mode: str):
+        if self.cassette is not None:
+            return await self.cassette.call('routes', json.dumps(self.leg_key(origin, destination, travel_mode)),
+                                            lambda: self._get_route_async(origin, destination, travel_mode),
+                                            slot=self.pool.slot)
+        return await self._get_route_async(origin, destination, travel_mode)
+
+    async def _get_route_async(self, origin: POI, destination: POI, travel_mode: str):
+        if self.route_cache is not None:
+            cached = self.route_cache.get(origin, destination, travel_mode)
+            if cached is not None:
+                return cached
+        headers, payload = self._route_request(origin, destination, travel_mode)
+        data = json.dumps(payload).encode('utf-8')
+        session = await self.pool.session()
+        async with self.pool.slot():
+            async with session.post(ROUTES_URL, headers=headers, data=data) as response:
+                body = await response.read()
+                self._record_call('routes', response.status, len(data), len(body))
+                if response.status == 200:
+                    logging.info("Route successfully retrieved.")
+                    route = json.loads(body)
+                    if self.route_cache is not None:
+                        self.route_cache.set(origin, destination, travel_mode, route)
+                    return route
+                logging.error("Failed to retrieve route information.")
+                return None
+
     def convert_polyline_to_gdf(self, route_polyline):
         """
         Decode polyline and visualize route using GeoDataFrame.
         """
-        polyline_coords = polyline.decode(route_polyline)
-        polyline_coords = [(lng, lat) for lat, lng in polyline_coords]
-        route_line = LineString(polyline_coords)
-        return route_line
+        coords, offsets = decode_polylines([route_polyline])
+        return to_linestrings(coords, offsets)[0]
 
     def convert_to_list_coords(self, lines):
-        polyline_coords = polyline.decode(lines)
-        polyline_coords = [[lng, lat] for lat, lng in polyline_coords]
-        return polyline_coords
+        return decode_polyline(lines).tolist()
+
+    def route_trip(self, route, departure=0.0):
+        """
+        Decode a Routes API route into coordinates and per-vertex timestamps.
 
-    def get_route_line(self, origin_poi, destination_poi, travel_mode):
-        """Get route line between two POIs using specified travel mode."""
+        Timestamps are minutes since midnight, starting at ``departure`` and spread over
+        the route's duration by cumulative distance along the line.
+        """
+        route = route['routes'][0]
+        coords, offsets = decode_polylines([route['polyline']['encodedPolyline']])
+        timestamps = departure + travel_fractions(coords, offsets) * parse_duration(route.get('duration')) / 60
+        return {
+            'coordinates': coords.tolist(),
+            'timestamps': timestamps.tolist(),
+            'duration': parse_duration(route.get('duration')),
+            'distance': route.get('distanceMeters'),
+        }
+
+    def get_route_line(self, origin_poi, destination_poi, travel_mode, departure=None):
+        """
+        Get route line between two POIs using specified travel mode.
+
+        With a ``departure`` minute, returns the route_trip dict (coordinates,
+        timestamps, duration, distance) instead of the bare coordinates.
+        """
         mode = 'WALK' if travel_mode == 'NONE' else travel_mode
         route = self.get_route(origin_poi, destination_poi, mode)
+        if departure is not None:
+            return self.route_trip(route, departure)
         
         # Check if we have a valid route with actual points
         lines = route['routes'][0]['polyline']['encodedPolyline']
         return self.convert_to_list_coords(lines)
 
+    async def get_route_line_async(self, origin_poi, destination_poi, travel_mode, departure=None):
+        """Get route line between two POIs without blocking the event loop."""
+        mode = 'WALK' if travel_mode == 'NONE' else travel_mode
+        route = await self.get_route_async(origin_poi, destination_poi, mode)
+        if departure is not None:
+            return self.route_trip(route, departure)
+        lines = route['routes'][0]['polyline']['encodedPolyline']
+        return self.convert_to_list_coords(lines)
+
     def convert_time_to_timestamp(self, time):
         return int(time.split(':')[0]) * 60 + int(time.split(':')[1])
 
-    def compute_routes(self, traces):
-        from concurrent.futures import ThreadPoolExecutor
-        import functools
-        
+    def plan_legs(self, plan, day_index):
+        """
+        Split one daily plan into legs between consecutive entries.
+
+        Returns the (origin, destination, mode) route requests together with each
+        leg's arrival minute (its destination entry's time), day index and travel mode.
+        The first entry of the day ends no leg, so it contributes no time.
+        """
+        entries = plan.entries
+        route_requests = []
+        time = []
+        day = []
+        travel_mode = []
+        for origin, destination in zip(entries[:-1], entries[1:]):
+            route_requests.append((
+                origin.poi_output,
+                destination.poi_output,
+                origin.travel_mode.value
+            ))
+            travel_mode.append(origin.travel_mode.value)
+        for entry in entries[1:]:
+            time.append(self.convert_time_to_timestamp(entry.time))
+            day.append(day_index)
+        return route_requests, time, day, travel_mode
+
+    def classify_leg(self, origin, destination, travel_mode):
+        """
+        Classify a leg before routing.
+
+        "unresolved": an endpoint's POI was not found, so the leg has no route.
+        "stay": same POI or within ``stay_distance_metres``, emitted as a stationary segment.
+        "route": everything else, sent to the Routes API. A leg's mode is its origin
+        entry's, so NONE legs (e.g. breakfast, then cycling out) are routed as WALK
+        rather than drawn as straight lines.
+        """
+        if origin is None or destination is None:
+            return 'unresolved'
+        if haversine_metres(origin, destination) <= self.stay_distance_metres:
+            return 'stay'
+        return 'route'
+
+    async def _fetch_route(self, args):
+        """Fetch one leg and return its route (polyline, duration, distance), or None on failure."""
+        origin, destination, mode = args
+        try:
+            route = await self.get_route_async(origin, destination, 'WALK' if mode == 'NONE' else mode)
+            return route['routes'][0]
+        except Exception as e:
+            logging.error(f"Error fetching route: {e}")
+            return None
+
+    @staticmethod
+    def leg_key(origin, destination, travel_mode):
+        """Identity of a leg for deduplication: both endpoints and the travel mode."""
+        return (origin.latitude, origin.longitude, destination.latitude, destination.longitude, travel_mode)
+
+    async def route_legs(self, route_requests, arrivals, stats=None):
+        """
+        Route (origin, destination, mode) legs in order, skipping the API for stays.
+
+        Legs that recur (the daily commute, the usual gym) are routed once and the
+        result is fanned back out to every occurrence. Returns the coordinates of each
+        leg, per-vertex timestamps (minutes since midnight) placed so the leg reaches its
+        destination at its arrival minute, and the leg distance in metres (0 for stays).
+        Legs with an unresolved endpoint get None for all three. When ``stats`` is
+        given, leg counts and the number of API calls saved are added to it.
+        """
+        routes = [None] * len(route_requests)
+        timestamps = [None] * len(route_requests)
+        distances = [None] * len(route_requests)
+        # Leg key -> indices of every occurrence still to be routed
+        pending = {}
+        kinds = {'unresolved': 0, 'stay': 0, 'route': 0}
+        for index, (origin, destination, mode) in enumerate(route_requests):
+            kind = self.classify_leg(origin, destination, mode)
+            kinds[kind] += 1
+            if kind == 'stay':
+                routes[index] = [[origin.longitude, origin.latitude], [origin.longitude, origin.latitude]]
+                timestamps[index] = [arrivals[index], arrivals[index]]
+                distances[index] = 0
+            elif kind == 'route':
+                pending.setdefault(self.leg_key(origin, destination, mode), []).append(index)
+
+        fetched = await asyncio.gather(*(self._fetch_route(route_requests[indices[0]]) for indices in pending.values()))
+        found = [(indices, route) for indices, route in zip(pending.values(), fetched) if route is not None]
+        # Decode every fetched polyline in one vectorised pass; timestamps are placed on the
+        # full line, then simplified with the same mask so both stay aligned
+        coords, offsets = decode_polylines([route['polyline']['encodedPolyline'] for _, route in found])
+        durations = np.array([parse_duration(route.get('duration')) for _, route in found]) / 60
+        # Minutes before arrival at each vertex: the leg ends, not starts, at the scheduled time
+        elapsed = (travel_fractions(coords, offsets) - 1) * np.repeat(durations, np.diff(offsets))
+        if self.simplify_metres:
+            coords, offsets, keep = simplify_routes(coords, offsets, self.simplify_metres)
+            elapsed = elapsed[keep]
+        lines = to_lists(coords, offsets)
+        for (indices, route), line, start, end in zip(found, lines, offsets[:-1], offsets[1:]):
+            for occurrence, index in enumerate(indices):
+                # Copy repeats so later per-leg edits do not leak into the other occurrences
+                routes[index] = line if occurrence == 0 else [list(point) for point in line]
+                timestamps[index] = (elapsed[start:end] + arrivals[index]).tolist()
+                distances[index] = route.get('distanceMeters')
+        duplicates = kinds['route'] - len(pending)
+
+        if stats is not None:
+            stats['legs'] = stats.get('legs', 0) + len(route_requests)
+            stats['unresolved_legs'] = stats.get('unresolved_legs', 0) + kinds['unresolved']
+            stats['stationary_legs'] = stats.get('stationary_legs', 0) + kinds['stay']
+            stats['routed_legs'] = stats.get('routed_legs', 0) + kinds['route']
+            stats['duplicate_legs'] = stats.get('duplicate_legs', 0) + duplicates
+            stats['api_calls_saved'] = stats.get('api_calls_saved', 0) + kinds['stay'] + duplicates
+        return routes, timestamps, distances
+
+    async def compute_day_routes(self, plan, day_index, stats=None):
+        """Route the legs of a single day, e.g. as soon as its POIs are resolved."""
+        route_requests, time, day, travel_mode = self.plan_legs(plan, day_index)
+        routes, timestamps, distances = await self.route_legs(route_requests, time, stats)
+        return routes, time, day, travel_mode, timestamps, distances
+
+    async def compute_routes(self, traces, stats=None):
         # Create a list of all route requests upfront
         route_requests = []
         time = [] 
         day = []
         travel_mode = []
         for index, plan in enumerate(traces[-1]['plans']):
-            entries = plan.entries
-            for origin, destination in zip(entries[:-1], entries[1:]):
-                route_requests.append((
-                    origin.poi_output,
-                    destination.poi_output,
-                    origin.travel_mode.value
-                ))
-                travel_mode.append(origin.travel_mode.value)
-            for entry in entries:
-                # Skip the first entry as it is the home location
-                time.append(self.convert_time_to_timestamp(entry.time))
-                day.append(index)
-            time.pop(0)
-            day.pop(0)
-
-        # Define worker function
-        def fetch_route(args):
-            origin, destination, mode = args
-            try:
-                return self.get_route_line(origin, destination, mode)
-            except Exception as e:
-                logging.error(f"Error fetching route: {e}")
-                return None
+            day_requests, day_time, day_day, day_mode = self.plan_legs(plan, index)
+            route_requests += day_requests
+            time += day_time
+            day += day_day
+            travel_mode += day_mode
         
-        # Use ThreadPoolExecutor to fetch routes in parallel
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            routes = list(executor.map(fetch_route, route_requests))
+        # Route the whole week in one pass so legs repeated across days are fetched once;
+        # the shared pool bounds in-flight calls
+        routes, timestamps, distances = await self.route_legs(route_requests, time, stats)
         
-        return routes, time, day, travel_mode
+        return routes, time, day, travel_mode, timestamps, distances
 
 if __name__ == '__main__':  
     import dotenv 
@@ -160,7 +491,7 @@ if __name__ == '__main__':
     # Ensure valid location data before requesting route
     if home_location and work_location:        
         # Fetch route
-        routes_result = client.get_route(home_location, work_location)
+        routes_result = client.get_route(home_location, work_location, 'TRANSIT')
         
         # Check and visualize route if available
         if routes_result and 'routes' in routes_result:
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, Optional
+import os
+import sys
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+from utils.metrics import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RECORD, REPLAY = 'record', 'replay'
+
+
+class CassetteMiss(LookupError):
+    """A replayed run asked for an interaction that was never recorded."""
+
+
+def parse_latency(spec: Optional[str]) -> Dict[str, float]:
+    """Parse per-kind latencies such as ``"llm=1.5,places=0.05,routes=0.1"`` (seconds)."""
+    latency = {}
+    for item in (spec or '').split(','):
+        if item.strip():
+            kind, seconds = item.split('=')
+            latency[kind.strip()] = float(seconds)
+    return latency
+
+
+class Cassette:
+    """
+    Records LLM outputs and Places/Routes responses to a JSON lines file and replays them.
+
+    In ``record`` mode each call runs for real and its result is appended to the file
+    with the time it took. In ``replay`` mode no LLM or Google call is made: results are
+    served from the file after a synthetic delay, the recorded duration scaled by
+    ``latency_scale`` unless ``latency`` fixes the delay for that kind of call. Calls
+    are keyed by kind (``llm``, ``places``, ``routes``) and their rendered request, so a
+    replayed run must use the personas it was recorded with.
+
+    Recorded durations include any time a call queued for a pool or limiter slot while
+    recording, so record at low concurrency (or use fixed latencies) when replaying
+    at another. ``latency_scale=0`` leaves only the orchestration overhead. Calls served
+    from a cache while recording are stored without a duration and replay with the
+    mean recorded duration of their kind.
+    """
+
+    def __init__(self, path: str, mode: str = REPLAY, latency: Optional[Dict[str, float]] = None,
+                 latency_scale: float = 1.0):
+        """
+        Args:
+            path: JSON lines cassette file
+            mode: "record" or "replay"
+            latency: Fixed replay delay in seconds per kind, e.g. {"llm": 1.5}
+            latency_scale: Multiplier on recorded durations for kinds without a fixed delay
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency or {}
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self.interactions: Dict[tuple, Dict[str, Any]] = {}
+        self._mean_seconds: Dict[str, float] = {}
+        self.load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut short by an interrupted recording
+                        continue
+                    self.interactions[(record['kind'], record['key'])] = record
+        except FileNotFoundError:
+            if self.replaying:
+                raise
+        logger.info(f"Cassette {self.path}: {len(self.interactions)} interactions, {self.mode} mode")
+
+    def record(self, kind: str, key: str, value: Any, seconds: Optional[float]) -> None:
+        """Store one interaction; ``seconds`` is None for a result served from a cache."""
+        seconds = round(seconds, 4) if seconds is not None else None
+        record = {'kind': kind, 'key': key, 'value': value, 'seconds': seconds}
+        with self._lock:
+            previous = self.interactions.get((kind, key))
+            # The same request again, e.g. a place shared by several days, is stored once;
+            # only a live call's duration replaces the missing one of a cache hit
+            if previous is not None and previous['value'] == value:
+                if seconds is None or previous['seconds'] is not None:
+                    return
+            self.interactions[(kind, key)] = record
+            self._mean_seconds.pop(kind, None)
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+
+    def lookup(self, kind: str, key: str) -> Dict[str, Any]:
+        try:
+            record = self.interactions[(kind, key)]
+        except KeyError:
+            metrics.inc('cassette_misses_total', kind=kind)
+            raise CassetteMiss(f"No recorded {kind} interaction for {key[:80]!r}") from None
+        metrics.inc('cassette_replays_total', kind=kind)
+        return record
+
+    def mean_seconds(self, kind: str) -> float:
+        """Mean recorded duration of a kind, standing in for calls recorded without one."""
+        if kind not in self._mean_seconds:
+            durations = [record['seconds'] for (recorded_kind, _), record in self.interactions.items()
+                         if recorded_kind == kind and record['seconds'] is not None]
+            if not durations:
+                logger.warning(f"Cassette {self.path} has no timed {kind} calls; "
+                               f"cached ones replay without delay unless a fixed latency is set")
+            self._mean_seconds[kind] = sum(durations) / len(durations) if durations else 0.0
+        return self._mean_seconds[kind]
+
+    def delay(self, kind: str, record: Dict[str, Any]) -> float:
+        if kind in self.latency:
+            return self.latency[kind]
+        seconds = record['seconds'] if record['seconds'] is not None else self.mean_seconds(kind)
+        return seconds * self.latency_scale
+
+    async def call(self, kind: str, key: str, fetch: Callable[[], Awaitable[Any]],
+                   encode: Callable[[Any], Any] = None, decode: Callable[[Any], Any] = None,
+                   slot: Callable[[], AsyncContextManager] = None) -> Any:
+        """
+        Run ``fetch`` and record its result, or replay the recorded one. ``slot`` is held
+        while a replay waits, so replays queue on the same limits as live calls.
+        """
+        if self.replaying:
+            record = self.lookup(kind, key)
+            async with (slot() if slot else nullcontext()):
+                await asyncio.sleep(self.delay(kind, record))
+            return decode(record['value']) if decode and record['value'] is not None else record['value']
+        start = time.perf_counter()
+        result = await fetch()
+        value = encode(result) if encode and result is not None else result
+        self.record(kind, key, value, time.perf_counter() - start)
+        return result
+
+    def call_sync(self, kind: str, key: str, fetch: Callable[[], Any],
+                  encode: Callable[[Any], Any] = None, decode: Callable[[Any], Any] = None) -> Any:
+        """Blocking counterpart of ``call`` for the synchronous client methods."""
+        if self.replaying:
+            record = self.lookup(kind, key)
+            time.sleep(self.delay(kind, record))
+            return decode(record['value']) if decode and record['value'] is not None else record['value']
+        start = time.perf_counter()
+        result = fetch()
+        value = encode(result) if encode and result is not None else result
+        self.record(kind, key, value, time.perf_counter() - start)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for kind, _ in self.interactions:
+            counts[kind] = counts.get(kind, 0) + 1
+        return counts
@@ -0,0 +1,140 @@
+import json
+import logging
+import struct
+from itertools import chain
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+# Same palette as deckgl-trip-layer/src/App.js, with its 204 alpha
+TRACE_COLORS = [[65, 182, 196, 204], [255, 127, 14, 204], [44, 160, 44, 204]]
+
+
+def _day_index(day) -> int:
+    return DAYS.index(day) if isinstance(day, str) else int(day)
+
+
+def encode_trips(traces: Sequence[Dict[str, Any]], colors: Optional[List[List[int]]] = None) -> bytes:
+    """
+    Pack the trips of one or more traces into deck.gl binary attributes.
+
+    Each trace is a dict with ``routes``, ``time``, ``day`` and optionally ``timestamps``,
+    as returned by /generate-mobility-trace or stored under ``trip_layer`` in the front
+    end's trace JSON. Legs without a route are left out.
+
+    Layout (little endian): a uint32 header length, the JSON header padded to 4 bytes,
+    then the arrays the header points to::
+
+        positions     Float32 [lng, lat] per vertex     -> getPath (size 2)
+        timestamps    Float32 minutes since midnight    -> getTimestamps (size 1)
+        startIndices  Uint32 first vertex of each path, plus the total vertex count
+        day           Uint8 day index per path
+        trace         Uint32 trace index per path
+        colors        Uint8 RGBA per path, by trace     -> getColor: (_, {index}) => colors.subarray(4 * index, 4 * index + 4)
+
+    In the browser every array is a zero-copy view, e.g.
+    ``new Float32Array(buffer, header.positions.byteOffset, header.positions.length)``,
+    and the layer takes ``data: {length, startIndices, attributes: {getPath: {value: positions, size: 2}, ...}}``.
+    Colours are per path rather than per vertex, which keeps vertices at 12 bytes.
+    """
+    colors = colors or TRACE_COLORS
+    paths, path_times, path_days, path_traces = [], [], [], []
+    for trace_index, trace in enumerate(traces):
+        timestamps = trace.get('timestamps') or [None] * len(trace['routes'])
+        for route, arrival, day, leg_times in zip(trace['routes'], trace['time'], trace['day'], timestamps):
+            if not route:
+                continue
+            paths.append(route)
+            # Traces from before per-vertex timestamps only know the leg's scheduled minute
+            path_times.append(leg_times if leg_times else [arrival] * len(route))
+            path_days.append(_day_index(day))
+            path_traces.append(trace_index)
+
+    lengths = np.fromiter((len(path) for path in paths), dtype=np.uint32, count=len(paths))
+    start_indices = np.concatenate([[0], np.cumsum(lengths)]).astype(np.uint32)
+    vertex_count = int(start_indices[-1])
+    positions = np.fromiter(chain.from_iterable(chain.from_iterable(paths)), dtype=np.float32, count=2 * vertex_count)
+    timestamps = np.fromiter(chain.from_iterable(path_times), dtype=np.float32, count=vertex_count)
+    palette = np.asarray(colors, dtype=np.uint8)
+    path_colors = palette[np.asarray(path_traces, dtype=np.int64) % len(palette)]
+
+    arrays = [
+        ('positions', positions, 'float32', 2),
+        ('timestamps', timestamps, 'float32', 1),
+        ('startIndices', start_indices, 'uint32', 1),
+        ('day', np.asarray(path_days, dtype=np.uint8), 'uint8', 1),
+        ('trace', np.asarray(path_traces, dtype=np.uint32), 'uint32', 1),
+        ('colors', path_colors.reshape(-1), 'uint8', 4),
+    ]
+    header = {'length': len(paths), 'vertexCount': vertex_count, 'days': DAYS}
+
+    # Lay the arrays out after the header, each starting on a 4-byte boundary
+    layout = []
+    for name, array, dtype, size in arrays:
+        layout.append((name, np.ascontiguousarray(array, dtype=np.dtype(dtype).newbyteorder('<')), dtype, size))
+    header_bytes = b''
+    while True:
+        offset = 4 + len(header_bytes)
+        for name, array, dtype, size in layout:
+            offset += -offset % 4
+            header[name] = {'byteOffset': offset, 'length': int(array.size), 'type': dtype, 'size': size}
+            offset += array.nbytes
+        encoded = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        encoded += b' ' * (-(4 + len(encoded)) % 4)
+        # The offsets depend on the header's own length; repeat until it is stable
+        stable = len(encoded) == len(header_bytes)
+        header_bytes = encoded
+        if stable:
+            break
+
+    buffer = bytearray(struct.pack('<I', len(header_bytes)) + header_bytes)
+    for name, array, _, _ in layout:
+        buffer += b'\0' * (header[name]['byteOffset'] - len(buffer))
+        buffer += array.tobytes()
+    return bytes(buffer)
+
+
+def decode_trips(buffer: bytes) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """Read an encode_trips buffer back into its header and zero-copy NumPy views."""
+    (header_length,) = struct.unpack_from('<I', buffer, 0)
+    header = json.loads(buffer[4:4 + header_length])
+    arrays = {}
+    for name, value in header.items():
+        if isinstance(value, dict) and 'byteOffset' in value:
+            arrays[name] = np.frombuffer(buffer, dtype=np.dtype(value['type']).newbyteorder('<'),
+                                         count=value['length'], offset=value['byteOffset'])
+    return header, arrays
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    import time
+
+    parser = argparse.ArgumentParser(description="Convert trace JSON files into one deck.gl binary trips buffer")
+    parser.add_argument('traces', nargs='+', help="Trace JSON files (front end trip_layer format or API responses)")
+    parser.add_argument('-o', '--output', default='traces.bin')
+    args = parser.parse_args()
+
+    loaded = []
+    for path in args.traces:
+        with open(path) as f:
+            data = json.load(f)
+        loaded.append(data.get('trip_layer', data))
+    json_bytes = sum(os.path.getsize(path) for path in args.traces)
+
+    start = time.perf_counter()
+    buffer = encode_trips(loaded)
+    encoded = time.perf_counter() - start
+    with open(args.output, 'wb') as f:
+        f.write(buffer)
+
+    start = time.perf_counter()
+    header, arrays = decode_trips(buffer)
+    decoded = time.perf_counter() - start
+    logging.info(f"{len(loaded)} traces, {header['length']} paths, {header['vertexCount']} vertices")
+    logging.info(f"JSON {json_bytes} bytes -> binary {len(buffer)} bytes ({len(buffer) / json_bytes:.0%}), "
+                 f"encode {encoded * 1000:.1f} ms, decode {decoded * 1000:.2f} ms")
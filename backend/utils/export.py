@@ -0,0 +1,191 @@
+import logging
+import threading
+import uuid
+from itertools import chain
+from typing import List, Optional
+import os
+import sys
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+from model.output_classes import DailyPlan
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+# One route vertex: position and minutes since midnight
+ROUTE_POINT = pa.struct([('lon', pa.float64()), ('lat', pa.float64()), ('t', pa.float32())])
+CATEGORY = pa.dictionary(pa.int32(), pa.string())
+PARTITIONING = ds.partitioning(pa.schema([('day', pa.string())]), flavor='hive')
+
+SCHEDULE_SCHEMA = pa.schema([
+    ('persona', pa.string()),
+    ('day', pa.string()),
+    ('entry', pa.int16()),
+    ('time', pa.string()),
+    ('action', pa.string()),
+    ('poi_category', CATEGORY),
+    ('location', CATEGORY),
+    ('travel_mode', CATEGORY),
+    ('poi_name', pa.string()),
+    ('latitude', pa.float64()),
+    ('longitude', pa.float64()),
+    ('address', pa.string()),
+])
+ROUTES_SCHEMA = pa.schema([
+    ('persona', pa.string()),
+    ('day', pa.string()),
+    ('leg', pa.int16()),
+    # Minute the leg reaches its destination entry
+    ('arrival', pa.int16()),
+    ('travel_mode', CATEGORY),
+    ('distance', pa.int32()),
+    ('route', pa.list_(ROUTE_POINT)),
+])
+
+
+def schedule_table(persona_id: str, plans: List[DailyPlan]) -> pa.Table:
+    """One row per schedule entry, built column by column."""
+    columns = {name: [] for name in SCHEDULE_SCHEMA.names}
+    for day_index, plan in enumerate(plans):
+        if plan is None:
+            continue
+        for index, entry in enumerate(plan.entries):
+            poi = entry.poi_output
+            columns['day'].append(DAYS[day_index])
+            columns['entry'].append(index)
+            columns['time'].append(entry.time)
+            columns['action'].append(entry.action)
+            columns['poi_category'].append(entry.poi_category)
+            columns['location'].append(entry.location)
+            columns['travel_mode'].append(entry.travel_mode.value if hasattr(entry.travel_mode, 'value') else entry.travel_mode)
+            columns['poi_name'].append(poi.name if poi else None)
+            columns['latitude'].append(poi.latitude if poi else None)
+            columns['longitude'].append(poi.longitude if poi else None)
+            columns['address'].append(poi.address if poi else None)
+    columns['persona'] = [persona_id] * len(columns['day'])
+    return pa.table({name: pa.array(values, type=SCHEDULE_SCHEMA.field(name).type)
+                     for name, values in columns.items()}, schema=SCHEDULE_SCHEMA)
+
+
+def routes_table(persona_id: str, routes: list, time: List[int], day: List[int], travel_mode: List[str],
+                 timestamps: Optional[list] = None, distances: Optional[list] = None) -> pa.Table:
+    """
+    One row per leg with its route as list<struct<lon, lat, t>>.
+
+    Vertices are gathered into flat arrays once and wrapped as Arrow list offsets,
+    so no per-vertex Python objects are created on the Arrow side. Legs that could not
+    be routed are null, as are their distances in metres.
+    """
+    lengths = np.array([len(route) if route else 0 for route in routes], dtype=np.int32)
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int32)
+    coords = np.fromiter(chain.from_iterable(chain.from_iterable(route for route in routes if route)),
+                         dtype=np.float64, count=2 * int(offsets[-1])).reshape(-1, 2)
+    if timestamps is None:
+        timestamps = [None] * len(routes)
+    t = np.fromiter(chain.from_iterable(
+        leg_times if leg_times else [np.nan] * len(route)
+        for route, leg_times in zip(routes, timestamps) if route
+    ), dtype=np.float32, count=int(offsets[-1]))
+
+    points = pa.StructArray.from_arrays(
+        [pa.array(coords[:, 0]), pa.array(coords[:, 1]), pa.array(t, from_pandas=True)],
+        fields=list(ROUTE_POINT),
+    )
+    route_column = pa.ListArray.from_arrays(pa.array(offsets), points, mask=pa.array(lengths == 0))
+
+    # Leg number within its day
+    days = np.asarray(day, dtype=np.int64)
+    starts = np.flatnonzero(np.concatenate([[True], days[1:] != days[:-1]])) if len(days) else np.empty(0, dtype=np.int64)
+    leg = np.arange(len(days)) - np.repeat(starts, np.diff(np.append(starts, len(days))))
+
+    return pa.table({
+        'persona': pa.array([persona_id] * len(routes), pa.string()),
+        'day': pa.array([DAYS[index] for index in day], pa.string()),
+        'leg': pa.array(leg, pa.int16()),
+        'arrival': pa.array(time, pa.int16()),
+        'travel_mode': pa.array(travel_mode, pa.string()).dictionary_encode(),
+        'distance': pa.array(distances if distances is not None else [None] * len(routes), pa.int32()),
+        'route': route_column,
+    }).cast(ROUTES_SCHEMA)
+
+
+class TraceExporter:
+    """
+    Streams schedules and routes into day-partitioned Arrow datasets.
+
+    Personas are buffered as they complete and flushed every ``personas_per_file``
+    personas as one file per day, rows grouped by persona. Filtering on the ``persona``
+    column prunes by row-group statistics, without one tiny file per persona and day::
+
+        root/schedules/day=Monday/part-<batch>-0.parquet
+        root/routes/day=Monday/part-<batch>-0.parquet
+    """
+
+    def __init__(self, root: str, format: str = 'parquet', personas_per_file: int = 100):
+        """
+        Args:
+            root: Output directory
+            format: "parquet" (zstd compressed) or "ipc" (Arrow/Feather files)
+            personas_per_file: Personas buffered before their batch is written
+        """
+        self.root = root
+        self.format = format
+        self.personas_per_file = personas_per_file
+        self._schedules: List[pa.Table] = []
+        self._routes: List[pa.Table] = []
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _write(self, kind: str, tables: List[pa.Table]) -> None:
+        table = pa.concat_tables(tables).combine_chunks()
+        if table.num_rows == 0:
+            return
+        file_format = ds.ParquetFileFormat() if self.format == 'parquet' else ds.IpcFileFormat()
+        options = file_format.make_write_options(compression='zstd') if self.format == 'parquet' else None
+        ds.write_dataset(
+            table, os.path.join(self.root, kind), format=file_format, file_options=options,
+            partitioning=PARTITIONING,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.{'parquet' if self.format == 'parquet' else 'arrow'}",
+            existing_data_behavior='overwrite_or_ignore',
+        )
+
+    def write(self, persona_id: str, plans: List[DailyPlan], routes: list, time: List[int], day: List[int],
+              travel_mode: List[str], timestamps: Optional[list] = None, distances: Optional[list] = None) -> None:
+        """Add one persona's week, flushing the batch once it is full."""
+        schedules = schedule_table(str(persona_id), plans)
+        legs = routes_table(str(persona_id), routes, time, day, travel_mode, timestamps, distances)
+        with self._lock:
+            self._schedules.append(schedules)
+            self._routes.append(legs)
+            if len(self._routes) >= self.personas_per_file:
+                self._flush()
+
+    def _flush(self) -> None:
+        if not self._routes:
+            return
+        self._write('schedules', self._schedules)
+        self._write('routes', self._routes)
+        logging.info(f"Exported {len(self._routes)} personas to {self.root}")
+        self._schedules, self._routes = [], []
+
+    def flush(self) -> None:
+        """Write buffered personas now."""
+        with self._lock:
+            self._flush()
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def dataset(self, kind: str = 'routes') -> ds.Dataset:
+        """Open the "schedules" or "routes" dataset for analytics, e.g. ``.to_table(filter=...)``."""
+        return ds.dataset(os.path.join(self.root, kind), format=self.format, partitioning=PARTITIONING)
@@ -0,0 +1,204 @@
+import logging
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+import os
+import sys
+import numpy as np
+import geopandas as gpd
+import shapely
+from shapely.strtree import STRtree
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+from model.output_classes import POI
+from utils.geocoder import normalize_address
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+
+# Columns holding a place category in Overture (categories) and OSM-style (tag) extracts
+CATEGORY_COLUMNS = ['categories', 'category', 'amenity', 'shop', 'leisure', 'tourism', 'office',
+                    'railway', 'public_transport', 'building', 'place']
+# Columns holding the neighbourhood or town a place belongs to
+LOCALITY_COLUMNS = ['addresses', 'locality', 'addr:suburb', 'addr:city', 'suburb']
+# British National Grid, used for distances in metres
+METRIC_CRS = 27700
+# Search rings, in metres, around the resolved locality
+SEARCH_RADII = [500, 2000, 10000]
+# Personal places no gazetteer row stands for; they resolve to their locality
+PERSONAL_ANCHORS = {'home', 'house', 'office', 'work', 'workplace'}
+
+
+def _tokens(text: str) -> Set[str]:
+    tokens = set()
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        tokens.add(token)
+        # Cheap plural folding so "cafes" matches "cafe" and "shops" matches "shop"
+        if len(token) > 3 and token.endswith('s'):
+            tokens.add(token[:-1])
+    return tokens
+
+
+def _flatten(value) -> str:
+    """Flatten Overture-style nested values (structs, lists of structs) into text."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ''
+    if isinstance(value, dict):
+        return ' '.join(_flatten(item) for item in value.values())
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return ' '.join(_flatten(item) for item in value)
+    return str(value).replace('_', ' ')
+
+
+def _name(value) -> str:
+    # Overture stores names as a struct with the display name under "primary"
+    if isinstance(value, dict):
+        return str(value.get('primary') or '')
+    return _flatten(value)
+
+
+class LocalPOIBackend:
+    """
+    Offline drop-in for GoogleAPIClient place lookups backed by a local gazetteer.
+
+    Loads a Parquet/GeoParquet or GeoPackage of London places (Overture or OSM-style
+    columns), builds a token index over names, categories and localities and an
+    STR-tree over the projected points. A "poi_category, location" query first
+    resolves the locality to an anchor point, then returns the nearest place whose
+    name or category contains every token of the category. Personal anchors ("Home",
+    "Office", "Work") and categories without a full match resolve to the locality
+    itself; places sharing only some tokens are used when no locality matches either.
+    """
+
+    def __init__(self, path: str, name_column: str = 'names'):
+        """
+        Args:
+            path: .parquet or .gpkg file of places with point (or polygon) geometries
+            name_column: Column holding the place name ("names" for Overture, "name" for OSM)
+        """
+        places = gpd.read_parquet(path) if path.endswith('.parquet') else gpd.read_file(path)
+        if name_column not in places.columns and 'name' in places.columns:
+            name_column = 'name'
+        places = places[places.geometry.notna()].to_crs(4326).reset_index(drop=True)
+        points = places.geometry.representative_point()
+
+        self.names = [_name(value) for value in places[name_column]]
+        self.categories = [
+            ' '.join(_flatten(places[column].iloc[i]) for column in CATEGORY_COLUMNS if column in places.columns)
+            for i in range(len(places))
+        ]
+        self.localities = [
+            ' '.join(_flatten(places[column].iloc[i]) for column in LOCALITY_COLUMNS if column in places.columns)
+            for i in range(len(places))
+        ]
+        self.latitudes = points.y.to_numpy()
+        self.longitudes = points.x.to_numpy()
+        projected = points.to_crs(METRIC_CRS)
+        self.xy = np.column_stack([projected.x.to_numpy(), projected.y.to_numpy()])
+        self.tree = STRtree(shapely.points(self.xy))
+
+        # Token -> row indices, separately for what a place is and where it is
+        self.category_index: Dict[str, Set[int]] = defaultdict(set)
+        self.locality_index: Dict[str, Set[int]] = defaultdict(set)
+        for i, (name, category, locality) in enumerate(zip(self.names, self.categories, self.localities)):
+            for token in _tokens(name) | _tokens(category):
+                self.category_index[token].add(i)
+            for token in _tokens(name) | _tokens(locality):
+                self.locality_index[token].add(i)
+        self._results: Dict[str, Optional[POI]] = {}
+        logging.info(f"Loaded {len(self.names)} places from {path}")
+
+    def _match(self, index: Dict[str, Set[int]], text: str) -> Set[int]:
+        """Rows containing every token of ``text``."""
+        matches = None
+        for token in _tokens(text):
+            rows = index.get(token, set())
+            matches = set(rows) if matches is None else matches & rows
+            if not matches:
+                return set()
+        return matches or set()
+
+    def _best_match(self, index: Dict[str, Set[int]], text: str) -> Set[int]:
+        """Rows containing every token of ``text``, else those sharing the most tokens."""
+        matches = self._match(index, text)
+        if matches:
+            return matches
+        counts = defaultdict(int)
+        for token in _tokens(text):
+            for row in index.get(token, ()):
+                counts[row] += 1
+        if not counts:
+            return set()
+        best = max(counts.values())
+        return {row for row, count in counts.items() if count == best}
+
+    def _resolve_locality(self, parts: List[str]) -> Optional[List[int]]:
+        """Rows of the most specific locality part that matches."""
+        for part in parts:
+            rows = self._match(self.locality_index, part)
+            if rows:
+                return list(rows)
+        return None
+
+    def _nearest(self, anchor: np.ndarray, candidates: Set[int]) -> int:
+        anchor_point = shapely.Point(anchor)
+        for radius in SEARCH_RADII:
+            nearby = candidates.intersection(self.tree.query(anchor_point.buffer(radius)).tolist())
+            if nearby:
+                candidates = nearby
+                break
+        rows = np.fromiter(candidates, dtype=int)
+        distances = np.hypot(*(self.xy[rows] - anchor).T)
+        return int(rows[np.argmin(distances)])
+
+    def get_place_info(self, address: str) -> Optional[POI]:
+        """Resolve a "poi_category, location" query to a POI without any network call."""
+        key = normalize_address(address)
+        if key in self._results:
+            return self._results[key]
+
+        parts = key.split(', ')
+        category, locality_parts = parts[0], parts[1:]
+        locality_rows = self._resolve_locality(locality_parts)
+        if _tokens(category) <= PERSONAL_ANCHORS:
+            # "Home, Stratford" must not become the nearest "... Nursing Home"
+            candidates = set()
+        else:
+            candidates = self._match(self.category_index, category)
+            if not candidates and not locality_rows:
+                candidates = self._best_match(self.category_index, category)
+
+        if candidates:
+            anchor_rows = locality_rows or list(candidates)
+            row = self._nearest(np.median(self.xy[anchor_rows], axis=0), candidates)
+            poi = POI(name=self.names[row] or category.title(), latitude=float(self.latitudes[row]),
+                      longitude=float(self.longitudes[row]),
+                      address=', '.join(filter(None, [self.names[row], self.localities[row]])))
+        elif locality_rows:
+            # Generic places such as "Home" or "Office": use the locality itself
+            poi = POI(name=category.title(), latitude=float(np.median(self.latitudes[locality_rows])),
+                      longitude=float(np.median(self.longitudes[locality_rows])),
+                      address=', '.join(locality_parts))
+        else:
+            logging.warning(f"No local candidates found for {address}")
+            poi = None
+        self._results[key] = poi
+        return poi
+
+    async def get_place_info_async(self, address: str, refresh: bool = False) -> Optional[POI]:
+        return self.get_place_info(address)
+
+    async def get_places_info(self, addresses: List[str], refresh: bool = False) -> List[Optional[POI]]:
+        # Local lookups are deterministic, so a refresh would give the same answer
+        return [self.get_place_info(address) for address in addresses]
+
+
+if __name__ == '__main__':
+    import time
+    import dotenv
+    dotenv.load_dotenv()
+    backend = LocalPOIBackend(os.getenv('LOCAL_POI_PATH', 'london_places.parquet'))
+    for query in ['Home, Stratford, London', 'Cafe, West Kensington, London', 'Gym, Shoreditch, London']:
+        start = time.perf_counter()
+        poi = backend.get_place_info(query)
+        logging.info(f"{query} -> {poi} ({(time.perf_counter() - start) * 1000:.2f} ms)")
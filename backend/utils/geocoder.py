@@ -0,0 +1,90 @@
+import logging
+import re
+import unicodedata
+from typing import Any, Dict, Optional, Tuple
+import os
+import sys
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+from model.output_classes import POI
+from utils.cache import SQLiteCache
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+
+# Trailing address parts that do not narrow a query inside London
+REGION_SUFFIXES = {'london', 'greater london', 'uk', 'united kingdom', 'england', 'gb'}
+# Region words dropped from the end of the last part, as in "Stratford London"
+TRAILING_REGION_WORDS = {'london', 'uk'}
+# Words before a trailing region word that make it part of the name ("City of London", "East London")
+REGION_NAME_QUALIFIERS = {'of', 'the', 'east', 'west', 'north', 'south', 'central', 'greater', 'inner', 'outer'}
+
+
+def normalize_address(address: str) -> str:
+    """
+    Canonicalise a "poi_category, location" query so trivially different strings
+    share a cache entry, e.g. "Home, Stratford, London" and "home,  stratford london, UK".
+    """
+    text = unicodedata.normalize('NFKD', address).encode('ascii', 'ignore').decode('ascii')
+    text = text.lower().replace('&', ' and ').replace(';', ',')
+    # Keep commas as part separators, drop every other punctuation mark
+    text = re.sub(r"[^\w\s,]", ' ', text)
+    parts = [' '.join(part.split()) for part in text.split(',')]
+    parts = [part for part in parts if part]
+
+    # Drop trailing region parts, then a region word ending the last location part unless
+    # it belongs to the place name. The category part is never trimmed.
+    while len(parts) > 1 and parts[-1] in REGION_SUFFIXES:
+        parts.pop()
+    if len(parts) > 1:
+        words = parts[-1].split()
+        if len(words) > 1 and words[-1] in TRAILING_REGION_WORDS and words[-2] not in REGION_NAME_QUALIFIERS:
+            parts[-1] = ' '.join(words[:-1])
+    return ', '.join(parts)
+
+
+class GeocodeCache:
+    """
+    Persistent cache in front of Google Find Place lookups.
+
+    Queries are keyed by their normalised address. Lookups Places answered with
+    ZERO_RESULTS are remembered too, with a shorter TTL so they are retried eventually.
+    """
+
+    def __init__(self, path: str, ttl: float = 30 * 24 * 3600, negative_ttl: float = 24 * 3600,
+                 max_entries: int = 50000):
+        """
+        Args:
+            path: SQLite database file, may be shared with other caches
+            ttl: Seconds to keep resolved places
+            negative_ttl: Seconds to keep "no candidates" results
+            max_entries: Entries kept before least recently used are evicted
+        """
+        self.cache = SQLiteCache(path, namespace='geocode', max_entries=max_entries, ttl=ttl)
+        self.negative_ttl = negative_ttl
+        self.negative_hits = 0
+
+    key = staticmethod(normalize_address)
+
+    def get(self, address: str) -> Tuple[bool, Optional[POI]]:
+        """Return (found, poi); found is False on a miss, poi is None for a cached negative."""
+        value = self.cache.get(self.key(address))
+        if value is None:
+            return False, None
+        if value == 'null':
+            self.negative_hits += 1
+            return True, None
+        return True, POI.model_validate_json(value)
+
+    def set(self, address: str, poi: Optional[POI]) -> None:
+        if poi is None:
+            self.cache.set(self.key(address), 'null', ttl=self.negative_ttl)
+        else:
+            self.cache.set(self.key(address), poi.model_dump_json())
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        stats['negative_hits'] = self.negative_hits
+        # Every miss falls through to a Places API call
+        stats['api_calls'] = self.cache.misses
+        return stats
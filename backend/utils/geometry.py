@@ -0,0 +1,136 @@
+import logging
+from typing import Tuple
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+
+METRES_PER_DEGREE = 111320.0
+EARTH_RADIUS_METRES = 6371008.8
+
+
+def to_local_metres(coords: np.ndarray) -> np.ndarray:
+    """Project [lng, lat] to an equirectangular plane in metres; accurate to well under 1% across London."""
+    if len(coords) == 0:
+        return np.empty((0, 2))
+    scale = np.array([np.cos(np.radians(coords[:, 1].mean())), 1.0]) * METRES_PER_DEGREE
+    return coords * scale
+
+
+def haversine_steps(coords: np.ndarray) -> np.ndarray:
+    """Great-circle distance in metres between each [lng, lat] vertex and the next."""
+    lng, lat = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_METRES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def travel_fractions(coords: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Share of its route's length travelled at each vertex, from 0 at the first vertex to 1 at the last.
+
+    Routes of zero length fall back to an even spread over their vertices.
+    """
+    points = np.diff(offsets)
+    if len(coords) == 0:
+        return np.empty(0)
+    steps = np.concatenate([[0.0], haversine_steps(coords)])
+    # The first vertex of a route does not continue the previous route
+    steps[offsets[:-1][points > 0]] = 0.0
+    travelled = np.cumsum(steps)
+    route = np.repeat(np.arange(len(points)), points)
+    travelled -= travelled[offsets[:-1][route]]
+    totals = travelled[(offsets[1:] - 1)[route]]
+
+    position = np.arange(len(coords)) - offsets[:-1][route]
+    even = position / np.maximum(points[route] - 1, 1)
+    return np.where(totals > 0, travelled / np.where(totals > 0, totals, 1), even)
+
+
+def _segment_distances(points: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Distance from each point to the segment start-end (to the start if the segment is degenerate)."""
+    direction = ends - starts
+    length_sq = np.einsum('ij,ij->i', direction, direction)
+    t = np.einsum('ij,ij->i', points - starts, direction) / np.where(length_sq > 0, length_sq, 1)
+    closest = starts + np.clip(t, 0, 1)[:, None] * direction
+    return np.hypot(*(points - closest).T)
+
+
+def simplify_mask(coords: np.ndarray, offsets: np.ndarray, tolerance_metres: float) -> np.ndarray:
+    """
+    Douglas-Peucker over every route at once.
+
+    Each iteration splits all still-open segments of all routes in one vectorised pass,
+    so the number of Python iterations follows the recursion depth, not the vertex count.
+
+    Args:
+        coords: [lng, lat] vertices of all routes back to back
+        offsets: Route boundaries; route i is coords[offsets[i]:offsets[i + 1]]
+        tolerance_metres: Maximum distance a dropped vertex may lie from the simplified line
+
+    Returns:
+        Boolean mask over coords of the vertices to keep; first and last vertices of every
+        route are always kept, so apply the same mask to any per-vertex array (e.g. timestamps)
+    """
+    keep = np.zeros(len(coords), dtype=bool)
+    non_empty = offsets[1:] > offsets[:-1]
+    first, last = offsets[:-1][non_empty], offsets[1:][non_empty] - 1
+    keep[first] = True
+    keep[last] = True
+    xy = to_local_metres(coords)
+
+    starts, ends = first, last
+    while True:
+        open_segments = ends - starts > 1
+        starts, ends = starts[open_segments], ends[open_segments]
+        if starts.size == 0:
+            break
+        # Flat indices of every interior vertex, grouped by segment
+        interior = ends - starts - 1
+        group_starts = np.concatenate([[0], np.cumsum(interior)[:-1]])
+        segment = np.repeat(np.arange(len(starts)), interior)
+        index = np.arange(interior.sum()) - group_starts[segment] + starts[segment] + 1
+        distances = _segment_distances(xy[index], xy[starts][segment], xy[ends][segment])
+
+        farthest = np.maximum.reduceat(distances, group_starts)
+        split = farthest > tolerance_metres
+        # First vertex of each segment reaching its maximum distance
+        at_max = np.flatnonzero(distances == farthest[segment])
+        _, first_at_max = np.unique(segment[at_max], return_index=True)
+        pivots = index[at_max[first_at_max]][split]
+
+        keep[pivots] = True
+        starts, ends = np.concatenate([starts[split], pivots]), np.concatenate([pivots, ends[split]])
+    return keep
+
+
+def simplify_routes(coords: np.ndarray, offsets: np.ndarray,
+                    tolerance_metres: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Simplify flat route coordinates (as returned by decode_polylines).
+
+    Returns the kept coordinates, their route offsets and the keep mask over the input.
+    """
+    keep = simplify_mask(coords, offsets, tolerance_metres)
+    kept = np.concatenate([[0], np.cumsum(keep)])
+    return coords[keep], kept[offsets], keep
+
+
+if __name__ == '__main__':
+    import time
+    from polyline_codec import decode_polylines
+    import polyline
+
+    rng = np.random.default_rng(0)
+    routes = []
+    for _ in range(2000):
+        steps = rng.normal(0, 0.0002, size=(int(rng.integers(20, 400)), 2)) + 0.0001
+        routes.append(polyline.encode([(51.5 + lat, -0.1 + lng) for lat, lng in np.cumsum(steps, axis=0)]))
+    coords, offsets = decode_polylines(routes)
+    for tolerance in [1, 5, 10, 25]:
+        start = time.perf_counter()
+        simplified, new_offsets, keep = simplify_routes(coords, offsets, tolerance)
+        elapsed = time.perf_counter() - start
+        assert (simplified[new_offsets[:-1]] == coords[offsets[:-1]]).all()
+        assert (simplified[new_offsets[1:] - 1] == coords[offsets[1:] - 1]).all()
+        logging.info(f"{tolerance} m: {len(coords)} -> {len(simplified)} vertices "
+                     f"({len(simplified) / len(coords):.0%}) in {elapsed * 1000:.1f} ms")
@@ -0,0 +1,73 @@
+import asyncio
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+import aiohttp
+
+# Per-request semaphore, set by request_scope() and inherited by the tasks a request spawns
+_request_slots: contextvars.ContextVar[Optional[asyncio.Semaphore]] = contextvars.ContextVar(
+    'request_slots', default=None
+)
+
+
+class HTTPPool:
+    """
+    Process-wide aiohttp session with keep-alive and a global concurrency limit.
+
+    Every Places and Routes call goes through ``slot()``. Inside ``request_scope()`` a
+    call first takes one of the request's own slots, so a single large request cannot
+    hold every global slot while other requests wait.
+    """
+
+    def __init__(self, limit: int = 32, per_request_limit: int = 10, keepalive_timeout: float = 60):
+        self.limit = limit
+        self.per_request_limit = per_request_limit
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+        self._semaphore = None
+        self._loop = None
+
+    def configure(self, limit: Optional[int] = None, per_request_limit: Optional[int] = None) -> None:
+        """Change the limits; takes effect for sessions opened afterwards."""
+        self.limit = limit or self.limit
+        self.per_request_limit = per_request_limit or self.per_request_limit
+
+    async def session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating it for the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @contextmanager
+    def request_scope(self, limit: Optional[int] = None):
+        """Give the calls made inside this block (and its tasks) their own fair share."""
+        token = _request_slots.set(asyncio.Semaphore(limit or self.per_request_limit))
+        try:
+            yield
+        finally:
+            _request_slots.reset(token)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a request slot (if scoped) and a global slot for one HTTP call."""
+        await self.session()
+        request_slots = _request_slots.get()
+        if request_slots is None:
+            async with self._semaphore:
+                yield
+        else:
+            async with request_slots:
+                async with self._semaphore:
+                    yield
+
+
+http_pool = HTTPPool()
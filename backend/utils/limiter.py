@@ -0,0 +1,38 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
+
+class ConcurrencyLimiter:
+    """
+    Process-wide cap on concurrent calls to one upstream service (e.g. the LLM provider).
+
+    Wrap each call in ``async with limiter.slot():``. The semaphore is created for the
+    running event loop, like the HTTP pool's session.
+    """
+
+    def __init__(self, limit: int = 16):
+        self.limit = limit
+        self._semaphore = None
+        self._loop = None
+
+    def configure(self, limit: Optional[int] = None) -> None:
+        """Change the limit; takes effect for calls started afterwards."""
+        self.limit = limit or self.limit
+        self._loop = None
+
+    def _current(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._semaphore
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the ``limit`` slots for the duration of a call."""
+        async with self._current():
+            yield
+
+
+llm_limiter = ConcurrencyLimiter()
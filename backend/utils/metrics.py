@@ -0,0 +1,160 @@
+import contextvars
+import functools
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+
+def _label_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _series(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _nest(tree: Dict[str, Any], labels: Tuple[Tuple[str, str], ...], value: Any) -> None:
+    for _, label in labels[:-1]:
+        tree = tree.setdefault(label, {})
+    tree[labels[-1][1]] = value
+
+
+# Registry of the run in progress, set by run_scope() and inherited by the tasks a run spawns
+_run_metrics: contextvars.ContextVar[Optional['MetricsRegistry']] = contextvars.ContextVar(
+    'run_metrics', default=None
+)
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and timing summaries (count, sum, max).
+
+    Inside ``run_scope()`` every value recorded is also added to a registry of its own
+    for that run, which gives the per-response breakdown returned with each trace.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.summaries = defaultdict(lambda: [0, 0.0, 0.0])
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        with self._lock:
+            self.counters[(name, _label_key(labels))] += value
+        run = _run_metrics.get()
+        if run is not None and run is not self:
+            run.inc(name, value, **labels)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            summary = self.summaries[(name, _label_key(labels))]
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+        run = _run_metrics.get()
+        if run is not None and run is not self:
+            run.observe(name, value, **labels)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels):
+        """Decorator timing every call of a coroutine function into ``name``."""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def run_scope(self):
+        """Collect what is recorded inside this block (and its tasks) into a fresh registry."""
+        run = MetricsRegistry()
+        token = _run_metrics.set(run)
+        try:
+            yield run
+        finally:
+            _run_metrics.reset(token)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in self.counters.items()
+            ]
+            summaries = [
+                {'name': name, 'labels': dict(labels), 'count': count, 'sum': total,
+                 'mean': total / count if count else 0.0, 'max': maximum}
+                for (name, labels), (count, total, maximum) in self.summaries.items()
+            ]
+        return {'counters': counters, 'summaries': summaries}
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Compact view keyed by metric name, then by label values in label name order,
+        e.g. ``{'cache_lookups_total': {'llm': {'hit': 6, 'miss': 2}}}``. Timings
+        become ``{'count', 'seconds', 'max'}``.
+        """
+        tree: Dict[str, Any] = {}
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                value = int(value) if float(value).is_integer() else value
+                if labels:
+                    _nest(tree.setdefault(name, {}), labels, value)
+                else:
+                    tree[name] = value
+            for (name, labels), (count, total, maximum) in sorted(self.summaries.items()):
+                value = {'count': count, 'seconds': round(total, 6), 'max': round(maximum, 6)}
+                if labels:
+                    _nest(tree.setdefault(name, {}), labels, value)
+                else:
+                    tree[name] = value
+        return tree
+
+    def prometheus(self) -> str:
+        """Render every series in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            summaries = sorted((key, list(value)) for key, value in self.summaries.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{_series(name, labels)} {_number(value)}")
+        for (name, labels), (count, total, maximum) in summaries:
+            if name not in typed:
+                lines.append(f"# TYPE {name} summary")
+                typed.add(name)
+            lines.append(f"{_series(name + '_count', labels)} {count}")
+            lines.append(f"{_series(name + '_sum', labels)} {total:.6f}")
+        # Maxima are a separate gauge family; Prometheus summaries only carry count, sum and quantiles
+        for (name, labels), (_, _, maximum) in summaries:
+            if name + '_max' not in typed:
+                lines.append(f"# TYPE {name}_max gauge")
+                typed.add(name + '_max')
+            lines.append(f"{_series(name + '_max', labels)} {maximum:.6f}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,120 @@
+import logging
+from typing import List, Sequence, Tuple
+import numpy as np
+import shapely
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+
+# Google encoded polylines store coordinates as integers of 1e-5 degrees
+PRECISION = 5
+
+
+def decode_polylines(encoded: Sequence[str], precision: int = PRECISION) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Decode many Google encoded polylines in one vectorised pass.
+
+    Args:
+        encoded: Encoded polyline strings
+        precision: Decimal places used by the encoder (5 for the Routes API)
+
+    Returns:
+        coords: float64 array of shape (n_points, 2) holding [lng, lat] for every route back to back
+        offsets: int64 array of len(encoded) + 1; route i is coords[offsets[i]:offsets[i + 1]]
+    """
+    lengths = np.fromiter((len(line) for line in encoded), dtype=np.int64, count=len(encoded))
+    byte_offsets = np.concatenate([[0], np.cumsum(lengths)])
+    data = np.frombuffer(''.join(encoded).encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    if data.size == 0:
+        return np.empty((0, 2)), np.zeros(len(encoded) + 1, dtype=np.int64)
+
+    # Every character carries 5 bits; a clear 0x20 bit marks the last character of a value
+    is_end = (data & 0x20) == 0
+    value_starts = np.flatnonzero(np.concatenate([[True], is_end[:-1]]))
+    shifts = 5 * (np.arange(data.size) - np.repeat(value_starts, np.diff(np.append(value_starts, data.size))))
+    values = np.bitwise_or.reduceat((data & 0x1f) << shifts, value_starts)
+    # Zig-zag decode
+    values = np.where(values & 1, ~(values >> 1), values >> 1)
+
+    # Values alternate lat, lng; count each route's points from the value ends inside its bytes
+    end_counts = np.concatenate([[0], np.cumsum(is_end)])
+    points = (end_counts[byte_offsets[1:]] - end_counts[byte_offsets[:-1]]) // 2
+    offsets = np.concatenate([[0], np.cumsum(points)])
+
+    # Coordinates are deltas within a route: cumulative sum, restarted at every route
+    deltas = values[:2 * offsets[-1]].reshape(-1, 2)
+    totals = np.cumsum(deltas, axis=0)
+    before = np.vstack([np.zeros((1, 2), dtype=np.int64), totals])[offsets[:-1]]
+    latlng = totals - np.repeat(before, points, axis=0)
+    coords = np.ascontiguousarray(latlng[:, ::-1]) / 10 ** precision
+    return coords, offsets
+
+
+def decode_polyline(encoded: str, precision: int = PRECISION) -> np.ndarray:
+    """Decode a single encoded polyline to an (n, 2) array of [lng, lat]."""
+    return decode_polylines([encoded], precision)[0]
+
+
+def split_routes(coords: np.ndarray, offsets: np.ndarray) -> List[np.ndarray]:
+    """Per-route views into the flat coordinate array; no coordinates are copied."""
+    return [coords[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def to_lists(coords: np.ndarray, offsets: np.ndarray) -> List[List[List[float]]]:
+    """Per-route [[lng, lat], ...] lists for JSON responses, converted in one tolist() call."""
+    flat = coords.tolist()
+    return [flat[start:end] for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def to_linestrings(coords: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Build one shapely LineString per route in a single vectorised call."""
+    points = np.diff(offsets)
+    # A LineString needs two points; repeat the only vertex of single-point routes
+    single = np.flatnonzero(points == 1)
+    if single.size:
+        coords = np.insert(coords, offsets[single], coords[offsets[single]], axis=0)
+        points = points.copy()
+        points[single] = 2
+        offsets = np.concatenate([[0], np.cumsum(points)])
+    lines = np.full(len(points), None, dtype=object)
+    valid = points > 0
+    if valid.any():
+        indices = np.repeat(np.arange(valid.sum()), points[valid])
+        lines[valid] = shapely.linestrings(coords[:offsets[-1]], indices=indices)
+    return lines
+
+
+if __name__ == '__main__':
+    import time
+    import polyline
+
+    # Benchmark against the previous path: polyline.decode plus a [lng, lat] comprehension
+    rng = np.random.default_rng(0)
+    routes = []
+    for _ in range(5000):
+        steps = rng.normal(0, 0.0005, size=(int(rng.integers(20, 400)), 2))
+        routes.append(polyline.encode([(51.5 + lat, -0.1 + lng) for lat, lng in np.cumsum(steps, axis=0)]))
+
+    start = time.perf_counter()
+    expected = [[[lng, lat] for lat, lng in polyline.decode(line)] for line in routes]
+    baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    coords, offsets = decode_polylines(routes)
+    views = split_routes(coords, offsets)
+    vectorised = time.perf_counter() - start
+
+    start = time.perf_counter()
+    as_lists = to_lists(coords, offsets)
+    listed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lines = to_linestrings(coords, offsets)
+    geometries = time.perf_counter() - start
+
+    assert all(np.allclose(view, route) for view, route in zip(views, expected))
+    logging.info(f"{len(routes)} routes, {len(coords)} vertices")
+    logging.info(f"polyline package + comprehension: {baseline * 1000:.1f} ms")
+    logging.info(f"decode_polylines (flat array + views): {vectorised * 1000:.1f} ms ({baseline / vectorised:.1f}x)")
+    logging.info(f"  + to_lists() for JSON: {listed * 1000:.1f} ms")
+    logging.info(f"to_linestrings ({len(lines)} geometries): {geometries * 1000:.1f} ms")
@@ -0,0 +1,73 @@
+import json
+import logging
+import math
+from typing import Any, Dict, Optional
+import os
+import sys
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+from model.output_classes import POI
+from utils.cache import SQLiteCache
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+
+METRES_PER_DEGREE_LAT = 111320.0
+
+
+class RouteCache:
+    """
+    Persistent cache of Routes API results keyed by grid-snapped endpoints and travel mode.
+
+    Origin and destination are snapped to a grid of ``grid_metres`` cells, so the same
+    commute between POIs resolved a few metres apart is routed once. Only the encoded
+    polyline, duration and distance are kept. The SQLite file can be shared by several
+    worker processes.
+    """
+
+    def __init__(self, path: str, grid_metres: float = 25.0, ttl: Optional[float] = 30 * 24 * 3600,
+                 max_entries: int = 100000):
+        """
+        Args:
+            path: SQLite database file, may be shared with other caches
+            grid_metres: Snapping grid cell size in metres
+            ttl: Seconds to keep a route, None to keep until evicted
+            max_entries: Entries kept before least recently used are evicted
+        """
+        self.cache = SQLiteCache(path, namespace='routes', max_entries=max_entries, ttl=ttl)
+        self.grid_metres = grid_metres
+
+    def snap(self, latitude: float, longitude: float) -> str:
+        lat_step = self.grid_metres / METRES_PER_DEGREE_LAT
+        lat_cell = round(latitude / lat_step)
+        # Longitude cells shrink with latitude; use the snapped latitude so the cell is stable
+        lng_step = self.grid_metres / (METRES_PER_DEGREE_LAT * max(math.cos(math.radians(lat_cell * lat_step)), 1e-6))
+        return f"{lat_cell}:{round(longitude / lng_step)}"
+
+    def key(self, origin: POI, destination: POI, travel_mode: str) -> str:
+        return "|".join([
+            self.snap(origin.latitude, origin.longitude),
+            self.snap(destination.latitude, destination.longitude),
+            travel_mode,
+        ])
+
+    def get(self, origin: POI, destination: POI, travel_mode: str) -> Optional[Dict[str, Any]]:
+        """Return a cached Routes API response ({'routes': [...]}) or None."""
+        value = self.cache.get(self.key(origin, destination, travel_mode))
+        if value is None:
+            return None
+        return {'routes': [json.loads(value)]}
+
+    def set(self, origin: POI, destination: POI, travel_mode: str, response: Dict[str, Any]) -> None:
+        if not response or not response.get('routes'):
+            return
+        route = response['routes'][0]
+        value = {
+            'polyline': {'encodedPolyline': route['polyline']['encodedPolyline']},
+            'duration': route.get('duration'),
+            'distanceMeters': route.get('distanceMeters'),
+        }
+        self.cache.set(self.key(origin, destination, travel_mode), json.dumps(value))
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
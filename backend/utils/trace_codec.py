@@ -0,0 +1,293 @@
+import json
+import logging
+import struct
+import zlib
+from itertools import chain
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+
+MAGIC = b'TRC1'
+# Coordinates are stored as integers of 10^-precision degrees (5 -> about 1.1 m)
+DEFAULT_PRECISION = 5
+# Route timestamps are stored as integers of this many minutes (0.1 -> 6 s)
+DEFAULT_TIME_RESOLUTION = 0.1
+
+
+def zigzag(values: np.ndarray) -> np.ndarray:
+    """Map signed integers to unsigned ones so small magnitudes stay small."""
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def unzigzag(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.uint64)
+    return ((values >> np.uint64(1)).astype(np.int64)) ^ -((values & np.uint64(1)).astype(np.int64))
+
+
+def varint_encode(values: np.ndarray) -> bytes:
+    """LEB128-encode unsigned integers, 7 bits per byte, vectorised over the whole array."""
+    values = np.asarray(values, dtype=np.uint64)
+    if values.size == 0:
+        return b''
+    sizes = np.ones(values.size, dtype=np.int64)
+    for bits in range(7, 64, 7):
+        sizes += values >= np.uint64(1 << bits)
+    ends = np.cumsum(sizes)
+    out = np.zeros(ends[-1], dtype=np.uint8)
+    starts = ends - sizes
+    for k in range(int(sizes.max())):
+        rows = np.flatnonzero(sizes > k)
+        chunk = (values[rows] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        more = (sizes[rows] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[rows] + k] = (chunk | more).astype(np.uint8)
+    return out.tobytes()
+
+
+def varint_decode(data: bytes) -> np.ndarray:
+    """Inverse of varint_encode."""
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if raw.size == 0:
+        return np.empty(0, dtype=np.uint64)
+    is_end = raw < 0x80
+    value_starts = np.flatnonzero(np.concatenate([[True], is_end[:-1]]))
+    shifts = 7 * (np.arange(raw.size) - np.repeat(value_starts, np.diff(np.append(value_starts, raw.size))))
+    return np.bitwise_or.reduceat((raw & 0x7f).astype(np.uint64) << shifts.astype(np.uint64), value_starts)
+
+
+def _flat_coords(rows: List[Optional[list]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Flatten routes (lists of [lng, lat]) into an (n, 2) array and per-row vertex counts."""
+    lengths = np.fromiter((len(row) if row else 0 for row in rows), dtype=np.int64, count=len(rows))
+    coords = np.fromiter(chain.from_iterable(chain.from_iterable(row for row in rows if row)),
+                         dtype=np.float64, count=2 * int(lengths.sum())).reshape(-1, 2)
+    return coords, lengths
+
+
+def _column_kind(name: str, values: list) -> str:
+    """Pick the encoding of a scalar column: int, float or categorical (strings)."""
+    present = [value for value in values if value is not None]
+    if any(isinstance(value, (bool, np.bool_)) for value in present):
+        raise ValueError(f"Unsupported column {name!r}: booleans")
+    if all(isinstance(value, str) for value in present):
+        return 'categorical'
+    if all(isinstance(value, (int, np.integer)) for value in present):
+        return 'int'
+    if all(isinstance(value, (int, float, np.integer, np.floating)) for value in present):
+        if not np.all(np.isfinite(np.asarray(present, dtype=np.float64))):
+            raise ValueError(f"Unsupported column {name!r}: non-finite floats")
+        return 'float'
+    raise ValueError(f"Unsupported column {name!r}: expected strings, ints or floats")
+
+
+class _Writer:
+    """Collects varint sections and describes them in the header."""
+
+    def __init__(self):
+        self.sections: List[bytes] = []
+
+    def ints(self, values, signed: bool = True) -> int:
+        values = np.asarray(values, dtype=np.int64)
+        self.sections.append(varint_encode(zigzag(values) if signed else values))
+        return len(self.sections) - 1
+
+    def deltas(self, values) -> int:
+        values = np.asarray(values, dtype=np.int64)
+        return self.ints(np.diff(values, prepend=0) if values.size else values)
+
+    def categorical(self, values: list) -> Dict[str, Any]:
+        dictionary, codes = np.unique(np.array(['' if v is None else str(v) for v in values], dtype=object),
+                                      return_inverse=True)
+        return {'kind': 'categorical', 'values': dictionary.tolist(), 'section': self.ints(codes, signed=False)}
+
+
+class _Reader:
+    def __init__(self, sections: List[bytes]):
+        self.sections = sections
+
+    def ints(self, section: int, signed: bool = True) -> np.ndarray:
+        values = varint_decode(self.sections[section])
+        return unzigzag(values) if signed else values.astype(np.int64)
+
+    def deltas(self, section: int) -> np.ndarray:
+        return np.cumsum(self.ints(section))
+
+    def categorical(self, column: Dict[str, Any]) -> list:
+        dictionary = np.array(column['values'], dtype=object)
+        return dictionary[self.ints(column['section'], signed=False)].tolist()
+
+
+def encode_trace(trace: Dict[str, Any], precision: int = DEFAULT_PRECISION,
+                 time_resolution: float = DEFAULT_TIME_RESOLUTION, compress: bool = True) -> bytes:
+    """
+    Encode a front end trace ({"trip_layer": {...}, "point_layer": {...}}) compactly.
+
+    Coordinates are quantised to ``precision`` decimal places and delta-encoded across
+    the whole layer, route timestamps are quantised to ``time_resolution`` minutes and
+    delta-encoded, leg arrival minutes are delta-encoded, and strings such as days,
+    travel modes, POI names and actions are dictionary-encoded. Other float columns are
+    quantised to ``precision`` decimal places and delta-encoded. Integers are written as
+    zig-zag varints and the result is zlib-compressed unless ``compress`` is False.
+
+    Raises:
+        ValueError: A column holds values other than strings, ints or floats
+    """
+    scale = 10 ** precision
+    writer = _Writer()
+    header: Dict[str, Any] = {'precision': precision, 'time_resolution': time_resolution, 'layers': {}}
+
+    for layer_name, layer in trace.items():
+        columns: Dict[str, Any] = {}
+        length = None
+        for name, values in layer.items():
+            length = len(values) if length is None else length
+            if name in ('routes', 'coordinates'):
+                rows = values if name == 'routes' else [[point] if point else None for point in values]
+                coords, lengths = _flat_coords(rows)
+                quantised = np.round(coords * scale).astype(np.int64)
+                columns[name] = {
+                    'kind': 'routes' if name == 'routes' else 'points',
+                    'lengths': writer.ints(lengths, signed=False),
+                    'nulls': [index for index, row in enumerate(values) if row is None],
+                    'lng': writer.deltas(quantised[:, 0]),
+                    'lat': writer.deltas(quantised[:, 1]),
+                }
+            elif name == 'timestamps':
+                lengths = np.fromiter((len(leg) if leg else 0 for leg in values), dtype=np.int64, count=len(values))
+                flat = np.fromiter(chain.from_iterable(leg for leg in values if leg), dtype=np.float64,
+                                   count=int(lengths.sum()))
+                columns[name] = {
+                    'kind': 'timestamps',
+                    'lengths': writer.ints(lengths, signed=False),
+                    'nulls': [index for index, row in enumerate(values) if row is None],
+                    'values': writer.deltas(np.round(flat / time_resolution)),
+                }
+            elif (kind := _column_kind(name, values)) == 'int':
+                columns[name] = {
+                    'kind': 'int',
+                    'nulls': [index for index, value in enumerate(values) if value is None],
+                    'section': writer.deltas([0 if value is None else value for value in values]),
+                }
+            elif kind == 'float':
+                quantised = np.round(np.array([0.0 if value is None else value for value in values]) * scale)
+                columns[name] = {
+                    'kind': 'float',
+                    'nulls': [index for index, value in enumerate(values) if value is None],
+                    'section': writer.deltas(quantised),
+                }
+            else:
+                column = writer.categorical(values)
+                column['nulls'] = [index for index, value in enumerate(values) if value is None]
+                columns[name] = column
+        header['layers'][layer_name] = {'length': length or 0, 'columns': columns}
+
+    header['sections'] = [len(section) for section in writer.sections]
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    payload = struct.pack('<I', len(header_bytes)) + header_bytes + b''.join(writer.sections)
+    flags = 1 if compress else 0
+    return MAGIC + bytes([flags]) + (zlib.compress(payload, 9) if compress else payload)
+
+
+def _rows(coords: np.ndarray, lengths: np.ndarray, nulls: List[int]) -> list:
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).tolist()
+    flat = coords.tolist()
+    rows = [flat[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    for index in nulls:
+        rows[index] = None
+    return rows
+
+
+def decode_trace(data: bytes) -> Dict[str, Any]:
+    """Decode an encode_trace buffer back into the front end trace structure."""
+    if data[:4] != MAGIC:
+        raise ValueError("Not an encoded trace")
+    payload = zlib.decompress(data[5:]) if data[4] & 1 else data[5:]
+    (header_length,) = struct.unpack_from('<I', payload, 0)
+    header = json.loads(payload[4:4 + header_length])
+    sections, offset = [], 4 + header_length
+    for size in header['sections']:
+        sections.append(payload[offset:offset + size])
+        offset += size
+    reader = _Reader(sections)
+    scale = 10 ** header['precision']
+
+    trace = {}
+    for layer_name, layer in header['layers'].items():
+        decoded = {}
+        for name, column in layer['columns'].items():
+            kind = column['kind']
+            if kind in ('routes', 'points'):
+                coords = np.column_stack([reader.deltas(column['lng']), reader.deltas(column['lat'])]) / scale
+                rows = _rows(coords, reader.ints(column['lengths'], signed=False), column['nulls'])
+                decoded[name] = rows if kind == 'routes' else [row[0] if row else None for row in rows]
+            elif kind == 'timestamps':
+                values = reader.deltas(column['values']) / (1 / header['time_resolution'])
+                decoded[name] = _rows(values, reader.ints(column['lengths'], signed=False), column['nulls'])
+            else:
+                if kind == 'int':
+                    values = reader.deltas(column['section']).tolist()
+                elif kind == 'float':
+                    values = (reader.deltas(column['section']) / scale).tolist()
+                else:
+                    values = reader.categorical(column)
+                for index in column['nulls']:
+                    values[index] = None
+                decoded[name] = values
+        trace[layer_name] = decoded
+    return trace
+
+
+def assert_round_trip(trace: Dict[str, Any], decoded: Dict[str, Any], precision: int = DEFAULT_PRECISION,
+                      time_resolution: float = DEFAULT_TIME_RESOLUTION) -> None:
+    """Check a decoded trace against its source: strings and ints exact, floats within quantisation."""
+    tolerance = 0.5 / 10 ** precision + 1e-9
+    for layer_name, layer in trace.items():
+        for name, values in layer.items():
+            result = decoded[layer_name][name]
+            assert len(result) == len(values), (layer_name, name)
+            if name in ('routes', 'coordinates', 'timestamps'):
+                atol = time_resolution / 2 + 1e-6 if name == 'timestamps' else tolerance
+                for expected, actual in zip(values, result):
+                    assert (expected is None) == (actual is None), (layer_name, name)
+                    if expected is not None:
+                        assert np.allclose(np.asarray(expected, dtype=float), np.asarray(actual, dtype=float),
+                                           rtol=0, atol=atol), (layer_name, name)
+            elif _column_kind(name, values) == 'float':
+                for expected, actual in zip(values, result):
+                    assert (expected is None) == (actual is None), (layer_name, name)
+                    if expected is not None:
+                        assert abs(expected - actual) <= tolerance, (layer_name, name)
+            else:
+                assert list(values) == list(result), (layer_name, name)
+
+
+if __name__ == '__main__':
+    import argparse
+    import gzip
+    import os
+    import time
+
+    parser = argparse.ArgumentParser(description="Encode trace JSON files and check they round-trip")
+    parser.add_argument('traces', nargs='+')
+    parser.add_argument('--write', action='store_true', help="Write <name>.trc next to each input")
+    args = parser.parse_args()
+
+    for path in args.traces:
+        with open(path) as f:
+            trace = json.load(f)
+        raw = os.path.getsize(path)
+        start = time.perf_counter()
+        encoded = encode_trace(trace)
+        encode_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        decoded = decode_trace(encoded)
+        decode_ms = (time.perf_counter() - start) * 1000
+        assert_round_trip(trace, decoded)
+        assert_round_trip(trace, decode_trace(encode_trace(trace, compress=False)))
+        logging.info(f"{path}: JSON {raw} B, gzip JSON {len(gzip.compress(open(path, 'rb').read(), 9))} B, "
+                     f"encoded {len(encoded)} B ({len(encoded) / raw:.1%}), "
+                     f"encode {encode_ms:.1f} ms, decode {decode_ms:.1f} ms, round trip OK")
+        if args.write:
+            with open(os.path.splitext(path)[0] + '.trc', 'wb') as f:
+                f.write(encoded)